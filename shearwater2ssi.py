@@ -8,15 +8,175 @@ Not affiliated with Shearwater Research Inc., SSI, or any diving organization.
 USE AT YOUR OWN RISK. See DISCLAIMER.md for full legal disclaimer.
 """
 
-import sqlite3
-import qrcode
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from datetime import datetime
 import os
 from PIL import Image, ImageTk
-import io
 import json
+import threading
+import queue
+import time
+
+import ssi_profiles
+from ssi_core import (
+    ALL_REGIONS, LOGBOOK_CACHE_MB, NO_SITE_LABEL, QR_INDEX_FILE, QR_OUTPUT_MODES, SITES_DIR,
+    DiveSiteCatalog, LogbookCache, build_ssi_payload, dive_qr_filename, dive_tree_columns, find_region_files,
+    list_png_files, load_dive_rows, load_image, qr_version_summary, sync_qr_files, unique_qr_filename
+)
+
+
+class ScanKiosk:
+    """Full-screen scan mode that steps through QR codes for scanning with a phone.
+    
+    The frames just ahead of the current position are scaled to the screen in a
+    background thread, so advancing only swaps an already converted image. Only
+    that window of frames is kept scaled, whatever the length of the session.
+    """
+    
+    PHOTO_WINDOW = 3  # frames scaled and converted ahead of the current one
+    
+    def __init__(self, root, frames, interval_ms=4000, auto_advance=True):
+        self.frames = frames
+        self.interval_ms = interval_ms
+        self.paused = not auto_advance
+        self.index = 0
+        self.after_id = None
+        self.photos = {}
+        self.rendered = {}  # index -> threading.Event, set once scaled[index] is ready
+        self.scaled = {}
+        self.render_queue = queue.Queue()
+        self.stop_event = threading.Event()
+        
+        self.window = tk.Toplevel(root, background='white')
+        self.window.attributes('-fullscreen', True)
+        self.window.focus_force()
+        screen_w = self.window.winfo_screenwidth()
+        screen_h = self.window.winfo_screenheight()
+        with_profile = any('profile' in f or 'profile_path' in f for f in frames)
+        profile_room = ssi_profiles.PROFILE_HEIGHT + 10 if with_profile else 0
+        self.side = max(100, int(min(screen_w, screen_h * 0.85 - profile_room)))
+        
+        self.status_label = tk.Label(self.window, background='white', font=('TkDefaultFont', 14))
+        self.status_label.pack(side=tk.TOP, pady=5)
+        self.image_label = tk.Label(self.window, background='white')
+        self.image_label.pack(expand=True)
+        self.caption_label = tk.Label(self.window, background='white', font=('TkDefaultFont', 16))
+        self.caption_label.pack(side=tk.BOTTOM, pady=10)
+        self.profile_label = tk.Label(self.window, background='white')
+        self.profile_label.pack(side=tk.BOTTOM)
+        
+        for key in ('<space>', '<Right>', '<Return>'):
+            self.window.bind(key, lambda e: self.step(1))
+        for key in ('<Left>', '<BackSpace>'):
+            self.window.bind(key, lambda e: self.step(-1))
+        self.window.bind('<p>', lambda e: self.toggle_pause())
+        self.window.bind('<plus>', lambda e: self.change_interval(-500))
+        self.window.bind('<minus>', lambda e: self.change_interval(500))
+        self.window.bind('<Escape>', lambda e: self.close())
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        threading.Thread(target=self._prerender, daemon=True).start()
+        self.show()
+    
+    def _prerender(self):
+        # Worker thread; it only touches the copies handed to it, never the caller's images.
+        # PhotoImages can only be created on the Tk thread.
+        while True:
+            job = self.render_queue.get()
+            if job is None or self.stop_event.is_set():
+                return
+            i, source, done = job
+            try:
+                if source.mode not in ('1', 'L'):
+                    source = source.convert('L')
+                self.scaled[i] = source.resize((self.side, self.side), Image.Resampling.NEAREST)
+            except Exception as e:
+                print(f"Could not render scan frame {i + 1}: {e}")
+                self.scaled[i] = Image.new('L', (self.side, self.side), 255)
+            done.set()
+    
+    def _schedule(self):
+        """Queue the frames of the window ahead and drop the ones left behind"""
+        window = range(self.index, min(self.index + self.PHOTO_WINDOW + 1, len(self.frames)))
+        for i in window:
+            if i not in self.rendered:
+                # Copied on the Tk thread, which owns the (lazily loaded) source images
+                self.rendered[i] = threading.Event()
+                frame = self.frames[i]
+                try:
+                    source = frame['image'].copy() if 'image' in frame else load_image(frame['path'])
+                except OSError as e:
+                    print(f"Could not load scan frame {i + 1}: {e}")
+                    source = Image.new('L', (1, 1), 255)
+                self.render_queue.put((i, source, self.rendered[i]))
+        for i in [i for i in self.rendered if i not in window and self.rendered[i].is_set()]:
+            del self.rendered[i]
+            self.scaled.pop(i, None)
+        for i in [i for i in self.photos if i not in window]:
+            del self.photos[i]
+    
+    def _photo(self, i):
+        if i not in self.photos:
+            self.rendered[i].wait()
+            self.photos[i] = ImageTk.PhotoImage(self.scaled[i])
+        return self.photos[i]
+    
+    def _prefetch(self):
+        # Convert the next frames while the current one is being scanned
+        for i in range(self.index + 1, min(self.index + self.PHOTO_WINDOW + 1, len(self.frames))):
+            if i not in self.photos and i in self.rendered and self.rendered[i].is_set():
+                self._photo(i)
+    
+    def show(self):
+        if self.after_id:
+            self.window.after_cancel(self.after_id)
+            self.after_id = None
+        
+        frame = self.frames[self.index]
+        self._schedule()
+        self.image_label.configure(image=self._photo(self.index))
+        self.caption_label.configure(text=frame.get('caption', ''))
+        profile = frame.get('profile')
+        if profile is None and 'profile_path' in frame:
+            try:
+                profile = load_image(frame['profile_path'])
+            except OSError:
+                profile = None
+        profile = ImageTk.PhotoImage(profile) if profile is not None else ''
+        self.profile_label.configure(image=profile)
+        self.profile_label.image = profile  # Keep a reference
+        
+        state = "Paused" if self.paused else f"Auto {self.interval_ms / 1000:.1f}s"
+        self.status_label.configure(
+            text=f"{self.index + 1}/{len(self.frames)}   {state}   "
+                 "[Space/→] next  [←] back  [P] pause  [+/-] speed  [Esc] exit")
+        
+        if not self.paused and self.index < len(self.frames) - 1:
+            self.after_id = self.window.after(self.interval_ms, lambda: self.step(1))
+        self.window.after_idle(self._prefetch)
+    
+    def step(self, delta):
+        new_index = self.index + delta
+        if 0 <= new_index < len(self.frames):
+            self.index = new_index
+            self.show()
+    
+    def toggle_pause(self):
+        self.paused = not self.paused
+        self.show()
+    
+    def change_interval(self, delta_ms):
+        self.interval_ms = max(500, self.interval_ms + delta_ms)
+        self.show()
+    
+    def close(self):
+        self.stop_event.set()
+        self.render_queue.put(None)
+        if self.after_id:
+            self.window.after_cancel(self.after_id)
+        self.photos.clear()
+        self.scaled.clear()
+        self.window.destroy()
 
 
 class ShearwaterToSSI:
@@ -30,8 +190,9 @@ class ShearwaterToSSI:
         self.dives_data = []
         self.selected_dives = []
         self.dive_regions = {}  # Available regions from JSON files
+        self.site_catalog = DiveSiteCatalog()  # Sites of all regions, indexed by ID
         self.current_region = None
-        self.dive_sites = {}
+        self.dive_sites = {}  # Site labels shown for the current region -> site ID
         self.dive_settings = {}
         self.generated_qr_codes = []
         self.validation_qr_codes = []
@@ -42,6 +203,9 @@ class ShearwaterToSSI:
         self.config = {}
         
         self.load_config()
+        cache_mb = self.config.get('defaults', {}).get('logbook_cache_mb', LOGBOOK_CACHE_MB)
+        # Loaded logbooks and QR folder listings, so switching back to a recent DB is instant
+        self.logbook_cache = LogbookCache(cache_mb * 1024 * 1024)
         self.scan_dive_regions()
         self.setup_ui()
         self.scan_for_db_files()
@@ -50,64 +214,53 @@ class ShearwaterToSSI:
         self.scan_existing_dive_qrs()
     
     def scan_dive_regions(self):
-        """Scan for region JSON files in ssi_dive_sites directory"""
-        sites_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ssi_dive_sites')
-        self.dive_regions = {}
+        """Scan for region JSON files in ssi_dive_sites directory and merge them into one catalog"""
+        self.dive_regions = find_region_files(SITES_DIR)
+        self.site_catalog = DiveSiteCatalog()
         
-        if os.path.exists(sites_dir):
-            for filename in os.listdir(sites_dir):
-                if filename.lower().endswith('.json'):
-                    region_name = os.path.splitext(filename)[0]
-                    region_name = region_name.replace('_', ' ').title()
-                    self.dive_regions[region_name] = os.path.join(sites_dir, filename)
-        
-        # Sort regions alphabetically
-        self.dive_regions = dict(sorted(self.dive_regions.items()))
+        for region_name, json_path in self.dive_regions.items():
+            try:
+                start = time.perf_counter()
+                count = self.site_catalog.add_region(region_name, json_path)
+                elapsed = time.perf_counter() - start
+                print(f"Loaded {count} dive sites from {region_name} ({count / max(elapsed, 1e-6):.0f} sites/s)")
+            except Exception as e:
+                print(f"Could not load dive sites from {region_name}: {e}")
         
         # Load first region if available
         if self.dive_regions:
             first_region = list(self.dive_regions.keys())[0]
             self.load_region_sites(first_region)
         else:
-            self.dive_sites = {"No Site (0)": "0"}
+            self.dive_sites = {NO_SITE_LABEL: "0"}
     
     def load_region_sites(self, region_name):
-        """Load dive sites from a specific region JSON file"""
+        """Show the dive sites of a region (or of all regions) from the merged catalog"""
         self.current_region = region_name
         self.dive_sites = {}
         
-        if region_name not in self.dive_regions:
-            self.dive_sites = {"No Site (0)": "0"}
-            return
-        
-        try:
-            json_path = self.dive_regions[region_name]
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if 'result' in data and 'elements' in data['result']:
-                    for site in data['result']['elements']:
-                        if 'data' in site and 'properties' in site['data']:
-                            props = site['data']['properties']
-                            site_id = props.get('id', '')
-                            site_name = props.get('name', '')
-                            if site_id and site_name:
-                                self.dive_sites[f"{site_name} ({site_id})"] = site_id
-                print(f"Loaded {len(self.dive_sites)} dive sites from {region_name}")
-        except Exception as e:
-            print(f"Could not load dive sites from {region_name}: {e}")
-            self.dive_sites = {"No Site (0)": "0"}
+        if region_name == ALL_REGIONS or region_name in self.site_catalog.regions:
+            for label in self.site_catalog.labels(region_name):
+                self.dive_sites[label] = self.site_catalog.parse_label(label)
         
         if not self.dive_sites:
-            self.dive_sites = {"No Site (0)": "0"}
-        
-        # Sort dive sites alphabetically
-        self.dive_sites = dict(sorted(self.dive_sites.items()))
+            self.dive_sites = {NO_SITE_LABEL: "0"}
         
         # Update site combo if UI is initialized
         if hasattr(self, 'site_combo'):
             self.site_combo['values'] = list(self.dive_sites.keys())
             if self.dive_sites:
                 self.site_combo.set(list(self.dive_sites.keys())[0])
+    
+    def on_site_search(self, event):
+        """Filter the site picker as the user types, searching by name prefix or ID"""
+        if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
+        text = self.site_combo.get()
+        if text in self.dive_sites:
+            return
+        matches = self.site_catalog.search(text, self.current_region)
+        self.site_combo['values'] = matches if matches else list(self.dive_sites.keys())
         
     def setup_ui(self):
         main_frame = ttk.Frame(self.root, padding="5")
@@ -190,7 +343,7 @@ class ShearwaterToSSI:
         
         # All settings in one row
         ttk.Label(settings_frame, text="Region:").pack(side=tk.LEFT, padx=2)
-        self.region_combo = ttk.Combobox(settings_frame, values=list(self.dive_regions.keys()), width=12, state='readonly')
+        self.region_combo = ttk.Combobox(settings_frame, values=[ALL_REGIONS] + list(self.dive_regions.keys()), width=12, state='readonly')
         self.region_combo.pack(side=tk.LEFT, padx=2)
         if self.dive_regions:
             self.region_combo.set(list(self.dive_regions.keys())[0])
@@ -201,6 +354,7 @@ class ShearwaterToSSI:
         self.site_combo.pack(side=tk.LEFT, padx=2)
         if self.dive_sites:
             self.site_combo.set(list(self.dive_sites.keys())[0])
+        self.site_combo.bind('<KeyRelease>', self.on_site_search)
         
         ttk.Label(settings_frame, text="Entry:").pack(side=tk.LEFT, padx=(8,2))
         self.entry_combo = ttk.Combobox(settings_frame, values=['Boat (22)', 'Shore (21)'], width=10)
@@ -222,14 +376,26 @@ class ShearwaterToSSI:
         # QR management options
         ttk.Separator(button_frame, orient='vertical').pack(side=tk.LEFT, fill='y', padx=10)
         
-        self.overwrite_var = tk.BooleanVar(value=True)
-        ttk.Checkbutton(button_frame, text="Overwrite existing", variable=self.overwrite_var).pack(side=tk.LEFT, padx=5)
+        # Replace all: delete and re-render every QR; Add to existing: keep other QRs;
+        # Reconcile: write only new or changed QRs and delete QRs of unselected dives
+        ttk.Label(button_frame, text="Output:").pack(side=tk.LEFT, padx=(5, 2))
+        self.output_mode_combo = ttk.Combobox(button_frame, values=QR_OUTPUT_MODES, width=14, state='readonly')
+        self.output_mode_combo.pack(side=tk.LEFT, padx=2)
+        default_mode = self.config.get('defaults', {}).get('qr_output_mode', 'Replace all')
+        self.output_mode_combo.set(default_mode if default_mode in QR_OUTPUT_MODES else 'Replace all')
+        
+        self.compact_qr_var = tk.BooleanVar(value=self.config.get('defaults', {}).get('compact_qr', False))
+        ttk.Checkbutton(button_frame, text="Compact QR", variable=self.compact_qr_var).pack(side=tk.LEFT, padx=5)
         
         self.existing_qr_label = ttk.Label(button_frame, text="")
         self.existing_qr_label.pack(side=tk.LEFT, padx=10)
         
         ttk.Button(button_frame, text="Clean Dive QRs", command=self.cleanup_dive_qrs).pack(side=tk.LEFT, padx=5)
         
+        ttk.Separator(button_frame, orient='vertical').pack(side=tk.LEFT, fill='y', padx=10)
+        ttk.Button(button_frame, text="Export Logbook", command=self.export_logbook).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Statistics", command=self.show_statistics).pack(side=tk.LEFT, padx=5)
+        
         # Bottom section: Output and QR display
         bottom_frame = ttk.Frame(main_frame)
         bottom_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=3)
@@ -281,6 +447,24 @@ class ShearwaterToSSI:
         self.next_btn = ttk.Button(nav_frame, text="Next ▶", command=self.show_next_qr, state='disabled')
         self.next_btn.pack(side=tk.RIGHT, padx=5)
         
+        # Full-screen scan mode controls
+        scan_frame = ttk.Frame(qr_frame)
+        scan_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        
+        scan_defaults = self.config.get('scan_mode', {})
+        ttk.Button(scan_frame, text="Scan Mode", command=self.start_scan_mode).pack(side=tk.LEFT, padx=5)
+        ttk.Label(scan_frame, text="Seconds per QR (0 = manual):").pack(side=tk.LEFT, padx=(10, 2))
+        self.scan_interval_var = tk.StringVar(value=str(scan_defaults.get('interval_seconds', 4)))
+        ttk.Spinbox(scan_frame, from_=0, to=60, increment=0.5, width=5,
+                    textvariable=self.scan_interval_var).pack(side=tk.LEFT, padx=2)
+        self.scan_interleave_var = tk.BooleanVar(value=scan_defaults.get('interleave_validation', False))
+        ttk.Checkbutton(scan_frame, text="Validation QR after each dive",
+                        variable=self.scan_interleave_var).pack(side=tk.LEFT, padx=10)
+        
+        # Dive profile sparkline under the QR code
+        self.profile_display = ttk.Label(qr_frame, anchor='center')
+        self.profile_display.pack(side=tk.BOTTOM, pady=(5, 0))
+        
         # QR code display label
         self.qr_display = ttk.Label(qr_frame, text="QR codes will appear here\nafter generation", anchor='center')
         self.qr_display.pack(expand=True, fill=tk.BOTH)
@@ -312,9 +496,16 @@ class ShearwaterToSSI:
                         'lastname': '',
                         'master_id': ''
                     },
+                    'scan_mode': {
+                        'interval_seconds': 4,
+                        'interleave_validation': False
+                    },
                     'defaults': {
                         'entry_type': 'Boat (22)',
-                        'auto_load_latest_db': True
+                        'qr_output_mode': 'Replace all',
+                        'compact_qr': False,
+                        'auto_load_latest_db': True,
+                        'logbook_cache_mb': LOGBOOK_CACHE_MB
                     }
                 }
                 self.save_config()
@@ -382,23 +573,23 @@ class ShearwaterToSSI:
         if self.config.get('defaults', {}).get('auto_load_latest_db', True) and self.db_combo['values']:
             latest_db = self.db_combo['values'][0]
             self.db_combo.set(latest_db)
-            self.db_path = self.db_files[latest_db]['path']
-            self.load_dives()
+            self.open_logbook(self.db_files[latest_db]['path'])
             self.file_label.config(text="Auto-loaded latest DB")
-            # Rescan validation QRs when DB changes
-            self.scan_validation_qrs()
-            self.scan_existing_dive_qrs()
     
     def on_db_selected(self, event):
         """Handle database selection from dropdown"""
         selected = self.db_combo.get()
         if selected and selected in self.db_files:
-            self.db_path = self.db_files[selected]['path']
-            self.load_dives()
+            self.open_logbook(self.db_files[selected]['path'])
             self.file_label.config(text="")
-            # Rescan validation QRs when DB changes
-            self.scan_validation_qrs()
-            self.scan_existing_dive_qrs()
+    
+    def open_logbook(self, db_path):
+        """Switch to a database, reusing its cached state if the file is unchanged"""
+        self.db_path = db_path
+        self.load_dives()
+        # Rescan validation QRs when DB changes
+        self.scan_validation_qrs()
+        self.scan_existing_dive_qrs()
     
     def refresh_db_list(self):
         """Refresh the list of database files"""
@@ -411,9 +602,8 @@ class ShearwaterToSSI:
                                               f"Found newer database: {latest_db}\nLoad it now?")
                 if response:
                     self.db_combo.set(latest_db)
-                    self.db_path = self.db_files[latest_db]['path']
-                    self.load_dives()
-                    self.scan_validation_qrs()
+                    self.open_logbook(self.db_files[latest_db]['path'])
+                    return
             self.scan_existing_dive_qrs()
         
     def select_file(self):
@@ -423,7 +613,6 @@ class ShearwaterToSSI:
         )
         
         if file_path:
-            self.db_path = file_path
             # Add to db_files if not already there
             filename = os.path.basename(file_path)
             if filename not in self.db_files:
@@ -436,68 +625,45 @@ class ShearwaterToSSI:
                 self.db_combo['values'] = sorted_files
             
             self.db_combo.set(filename)
+            self.open_logbook(file_path)
             self.file_label.config(text="Manually selected")
-            self.load_dives()
-            # Rescan validation QRs when DB changes
-            self.scan_validation_qrs()
-            self.scan_existing_dive_qrs()
             
     def load_dives(self):
         if not self.db_path:
             return
             
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            query = """
-            SELECT DiveId, DiveDate, Depth, DiveLengthTime, Site, Location,
-                   AverageDepth, AverageTemp, Weather, Visibility
-            FROM dive_details
-            ORDER BY DiveDate DESC
-            """
-            
-            cursor.execute(query)
-            self.dives_data = cursor.fetchall()
-            conn.close()
-            
-            for item in self.dive_tree.get_children():
-                self.dive_tree.delete(item)
-            
-            dive_idx = 0
-            for dive in self.dives_data:
-                dive_id, dive_date, depth, duration, site, location, avg_depth, avg_temp, weather, visibility = dive
-                
-                if dive_date:
-                    try:
-                        dt = datetime.strptime(dive_date, "%Y-%m-%d %H:%M:%S")
-                        date_str = dt.strftime("%Y-%m-%d")
-                        time_str = dt.strftime("%H:%M")
-                    except:
-                        date_str = dive_date[:10] if len(dive_date) >= 10 else "N/A"
-                        time_str = dive_date[11:16] if len(dive_date) >= 16 else "N/A"
-                else:
-                    date_str = "N/A"
-                    time_str = "N/A"
-                
-                depth_m = f"{float(depth):.1f}" if depth else "0.0"
-                duration_min = f"{int(duration)/60:.1f}" if duration else "0.0"
-                
-                default_site = list(self.dive_sites.keys())[0] if self.dive_sites else "No Site (0)"
+            # The cached state holds the live settings dict, so site and entry
+            # assignments survive switching to another database and back
+            state = self.logbook_cache.get(self.db_path)
+            source = "cache"
+            if state is None:
+                signature = LogbookCache.signature(self.db_path)
+                rows = load_dive_rows(self.db_path)
+                default_site = list(self.dive_sites.keys())[0] if self.dive_sites else NO_SITE_LABEL
                 default_entry = self.config.get('defaults', {}).get('entry_type', 'Boat (22)')
-                
-                self.dive_settings[dive_idx] = {
-                    'site': default_site,
-                    'entry_type': default_entry
+                default_site_id = self.site_catalog.resolve(default_site)
+                state = {
+                    'rows': rows,
+                    'columns': [dive_tree_columns(dive) for dive in rows],
+                    'settings': {
+                        dive_idx: {'site': default_site, 'site_id': default_site_id, 'entry_type': default_entry}
+                        for dive_idx in range(len(rows))
+                    }
                 }
-                
-                self.dive_tree.insert('', 'end', values=(
-                    date_str, time_str, depth_m, duration_min, default_site, default_entry
-                ))
-                dive_idx += 1
+                self.logbook_cache.put(self.db_path, state, signature)
+                source = "database"
+            
+            self.dives_data = state['rows']
+            self.dive_settings = state['settings']
+            
+            self.dive_tree.delete(*self.dive_tree.get_children())
+            for dive_idx, columns in enumerate(state['columns']):
+                settings = self.dive_settings[dive_idx]
+                self.dive_tree.insert('', 'end', values=columns + (settings['site'], settings['entry_type']))
                 
             self.output_text.delete(1.0, tk.END)
-            self.output_text.insert(tk.END, f"Loaded {len(self.dives_data)} dives from database\n")
+            self.output_text.insert(tk.END, f"Loaded {len(self.dives_data)} dives from {source}\n")
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load dives: {str(e)}")
@@ -523,10 +689,22 @@ class ShearwaterToSSI:
         site = self.site_combo.get()
         entry_type = self.entry_combo.get()
         
+        # Resolve the site once, so the assignment survives later region changes
+        site_id = self.site_catalog.resolve(site)
+        if site_id == "0" and site.strip() and site != NO_SITE_LABEL:
+            messagebox.showwarning("Unknown Site", f"'{site}' is not a known dive site.\n"
+                                   f"Pick a site from the list, or {NO_SITE_LABEL}.")
+            return
+        if site_id == "0":
+            site = NO_SITE_LABEL
+        else:
+            site = self.site_catalog.label(site_id)
+        
         for item in selected_items:
             item_index = self.dive_tree.index(item)
             self.dive_settings[item_index] = {
                 'site': site,
+                'site_id': site_id,
                 'entry_type': entry_type
             }
             
@@ -559,75 +737,85 @@ class ShearwaterToSSI:
         
         output_dir = os.path.join(os.path.dirname(self.db_path) if self.db_path else ".", "ssi_dives_qr_codes")
         os.makedirs(output_dir, exist_ok=True)
+        output_mode = self.output_mode_combo.get()
+        compact = self.compact_qr_var.get()
+        
+        self.output_text.delete(1.0, tk.END)
         
-        # Clean existing QRs if overwrite mode is selected
-        if self.overwrite_var.get() and os.path.exists(output_dir):
+        # Clean existing QRs if replace mode is selected
+        if output_mode == 'Replace all':
             for file in os.listdir(output_dir):
-                if file.endswith('.png'):
+                if file.endswith('.png') or file == QR_INDEX_FILE:
                     try:
                         os.remove(os.path.join(output_dir, file))
                     except:
                         pass
             self.output_text.insert(tk.END, "Cleaned existing QR codes\n")
         
-        self.output_text.delete(1.0, tk.END) if self.overwrite_var.get() else None
-        self.generated_qr_codes = [] if self.overwrite_var.get() else self.generated_qr_codes
-        generated_count = 0
+        if output_mode != 'Add to existing':
+            self.generated_qr_codes = []
         
+        entries = []
+        profile_dives = []
+        taken = set()
         for item in selected_items:
             item_index = self.dive_tree.index(item)
             dive_data = self.dives_data[item_index]
-            settings = self.dive_settings.get(item_index, {'site': 'No Site (0)', 'entry_type': 'Boat (22)'})
+            settings = self.dive_settings.get(item_index, {'site': NO_SITE_LABEL, 'site_id': '0', 'entry_type': 'Boat (22)'})
             
-            qr_payload = self.create_ssi_payload(dive_data, firstname, lastname, user_id, settings)
+            qr_payload = self.create_ssi_payload(dive_data, firstname, lastname, user_id, settings, compact)
+            filename, date_str = dive_qr_filename(dive_data[1], len(entries), dive_data[0])
+            filename = unique_qr_filename(filename, dive_data[0], taken)
+            taken.add(filename)
+            profile_dives.append((dive_data[0], filename))
             
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(qr_payload)
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            dive_date = dive_data[1]
-            if dive_date:
-                try:
-                    dt = datetime.strptime(dive_date, "%Y-%m-%d %H:%M:%S")
-                    filename = f"dive_{dt.strftime('%Y%m%d_%H%M%S')}.png"
-                    date_str = dt.strftime('%Y-%m-%d %H:%M')
-                except:
-                    filename = f"dive_{generated_count:03d}.png"
-                    date_str = f"Dive {generated_count + 1}"
-            else:
-                filename = f"dive_{generated_count:03d}.png"
-                date_str = f"Dive {generated_count + 1}"
-                
-            filepath = os.path.join(output_dir, filename)
-            img.save(filepath)
-            
-            # Store QR code for display
-            site_name = settings.get('site', 'Unknown')
-            entry_type = settings.get('entry_type', 'Unknown')
             depth = dive_data[2]
             duration = dive_data[3]
-            
-            self.generated_qr_codes.append({
-                'image': img,
+            entries.append({
+                'payload': qr_payload,
                 'filename': filename,
                 'date': date_str,
-                'site': site_name,
-                'entry': entry_type,
+                'site': settings.get('site', 'Unknown'),
+                'entry': settings.get('entry_type', 'Unknown'),
                 'depth': f"{float(depth):.1f}m" if depth else "0.0m",
                 'duration': f"{int(duration)/60:.1f}min" if duration else "0.0min"
             })
-            
-            self.output_text.insert(tk.END, f"Generated QR code: {filename}\n")
-            generated_count += 1
-            
+        
+        stats = sync_qr_files(output_dir, entries, remove_orphans=(output_mode == 'Reconcile'), compact=compact,
+                              source=os.path.abspath(self.db_path) if self.db_path else None)
+        versions = qr_version_summary([entry['payload'] for entry in entries], compact)
+        if compact:
+            standard_payloads = [
+                self.create_ssi_payload(self.dives_data[self.dive_tree.index(item)], firstname, lastname, user_id,
+                                        self.dive_settings.get(self.dive_tree.index(item), {}))
+                for item in selected_items
+            ]
+            versions += f" (standard payload: {qr_version_summary(standard_payloads)})"
+        
+        profiles = ssi_profiles.profile_thumbnails(self.db_path, profile_dives, output_dir) if self.db_path else {}
+        if output_mode != 'Add to existing':
+            ssi_profiles.prune_profiles(output_dir)
+        
+        for entry in entries:
+            if 'image' in entry:
+                self.output_text.insert(tk.END, f"Generated QR code: {entry['filename']}\n")
+            # Keep only the path; the file is read when the QR is displayed (see qr_image)
+            entry.pop('image', None)
+            entry['path'] = os.path.join(output_dir, entry['filename'])
+            if entry['filename'] in profiles:
+                entry['profile'] = profiles[entry['filename']]
+            del entry['payload']
+        # Replace earlier entries of regenerated dives instead of listing them twice
+        regenerated = {entry['filename'] for entry in entries}
+        self.generated_qr_codes = [qr for qr in self.generated_qr_codes if qr['filename'] not in regenerated] + entries
+        generated_count = stats['written']
+        
         self.output_text.insert(tk.END, f"\nSuccessfully generated {generated_count} QR codes in {output_dir}\n")
+        if stats['unchanged'] or stats['removed']:
+            self.output_text.insert(tk.END, f"Unchanged: {stats['unchanged']}, removed: {stats['removed']}\n")
+        self.output_text.insert(tk.END, f"QR versions: {versions}\n")
+        if profiles:
+            self.output_text.insert(tk.END, f"Dive profiles: {len(profiles)} of {len(entries)} dives\n")
         
         # Display first QR code
         if self.generated_qr_codes:
@@ -638,63 +826,88 @@ class ShearwaterToSSI:
         # Refresh existing QR count
         self.scan_existing_dive_qrs()
         
-        messagebox.showinfo("Success", f"Generated {generated_count} QR codes in {output_dir}")
+        messagebox.showinfo("Success", f"Generated {generated_count} QR codes in {output_dir}\n"
+                                       f"({stats['unchanged']} unchanged, {stats['removed']} removed)")
         
-    def create_ssi_payload(self, dive_data, firstname, lastname, user_id, settings):
-        dive_id, dive_date, depth, duration, site, location, avg_depth, avg_temp, weather, visibility = dive_data
+    def export_logbook(self):
+        """Export the selected dives (or all dives) with their site and entry settings to CSV or UDDF"""
+        from ssi_export import open_dive_writer
         
-        if dive_date:
-            try:
-                dt = datetime.strptime(dive_date, "%Y-%m-%d %H:%M:%S")
-                datetime_str = dt.strftime("%Y%m%d%H%M")
-            except:
-                datetime_str = "202501010000"
+        if not self.dives_data:
+            messagebox.showwarning("No Dives", "Load a database first")
+            return
+        
+        file_path = filedialog.asksaveasfilename(
+            title="Export Logbook",
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("UDDF files", "*.uddf")]
+        )
+        if not file_path:
+            return
+        
+        selected_items = self.dive_tree.selection()
+        if selected_items:
+            indexes = [self.dive_tree.index(item) for item in selected_items]
         else:
-            datetime_str = "202501010000"
-            
-        depth_m = float(depth) if depth else 0.0
-        divetime = float(duration) / 60.0 if duration else 0.0
+            indexes = range(len(self.dives_data))
         
-        site_name = settings.get('site', 'No Site (0)')
-        site_code = self.dive_sites.get(site_name, "0")
+        default_settings = {'site': NO_SITE_LABEL, 'site_id': '0', 'entry_type': 'Boat (22)'}
+        used_sites = {self.dive_settings.get(i, default_settings).get('site_id', '0') for i in indexes}
+        site_names = {s: self.site_catalog.sites[s]['name'] for s in used_sites if s in self.site_catalog.sites}
+        site_coords = {s: (self.site_catalog.sites[s]['lat'], self.site_catalog.sites[s]['lng'])
+                       for s in used_sites if s in self.site_catalog.sites}
         
-        entry_type = settings.get('entry_type', 'Boat (22)')
-        var_entry_id = "21" if "Shore" in entry_type else "22"
-        
-        var_weather_id = "1"
-        var_water_body_id = "13"
-        var_watertype_id = "5"
-        var_current_id = "6"
-        var_surface_id = "10"
-        var_divetype_id = "24"
-        
-        airtemp_c = float(avg_temp) if avg_temp else 0.0
-        vis_m = float(visibility) if visibility else 0.0
-        
-        payload = (
-            f"dive;noid;"
-            f"dive_type:0;"
-            f"divetime:{divetime:.1f};"
-            f"datetime:{datetime_str};"
-            f"depth_m:{depth_m:.1f};"
-            f"site:{site_code};"
-            f"var_weather_id:{var_weather_id};"
-            f"var_entry_id:{var_entry_id};"
-            f"var_water_body_id:{var_water_body_id};"
-            f"var_watertype_id:{var_watertype_id};"
-            f"var_current_id:{var_current_id};"
-            f"var_surface_id:{var_surface_id};"
-            f"var_divetype_id:{var_divetype_id};"
-            f"var_divetype_id:{var_divetype_id};"
-            f"user_master_id:{user_id};"
-            f"user_firstname:{firstname};"
-            f"user_lastname:{lastname};"
-            f"user_leader_id:;"
-            f"airtemp_c:{airtemp_c:.1f};"
-            f"vis_m:{vis_m:.1f}"
-        )
+        try:
+            writer = open_dive_writer(file_path, site_names, site_coords)
+            try:
+                for item_index in indexes:
+                    settings = self.dive_settings.get(item_index, default_settings)
+                    writer.write(self.dives_data[item_index], settings.get('site_id', '0'),
+                                 settings.get('entry_type', 'Boat (22)'))
+            finally:
+                writer.close()
+            count = writer.count
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export logbook: {str(e)}")
+            return
+        
+        self.output_text.insert(tk.END, f"\nExported {count} dives to {file_path}\n")
+        messagebox.showinfo("Success", f"Exported {count} dives to {file_path}")
+    
+    def show_statistics(self):
+        """Show logbook statistics for the current database in a separate window"""
+        from ssi_stats import compute_logbook_stats, format_stats_report
+        
+        if not self.db_path:
+            messagebox.showwarning("No Database", "Load a database first")
+            return
         
-        return payload
+        self.root.config(cursor='watch')
+        self.root.update_idletasks()
+        try:
+            report = format_stats_report(compute_logbook_stats(self.db_path))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to compute statistics: {str(e)}")
+            return
+        finally:
+            self.root.config(cursor='')
+        
+        window = tk.Toplevel(self.root)
+        window.title(f"Statistics - {os.path.basename(self.db_path)}")
+        window.geometry("700x600")
+        
+        text = tk.Text(window, font=('TkFixedFont', 9), wrap='none')
+        scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL, command=text.yview)
+        text.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text.pack(fill=tk.BOTH, expand=True)
+        text.insert(tk.END, report)
+        text.config(state='disabled')
+    
+    def create_ssi_payload(self, dive_data, firstname, lastname, user_id, settings, compact=False):
+        site_code = settings.get('site_id') or self.site_catalog.resolve(settings.get('site', NO_SITE_LABEL))
+        entry_type = settings.get('entry_type', 'Boat (22)')
+        return build_ssi_payload(dive_data, firstname, lastname, user_id, site_code, entry_type, compact)
     
     def scan_validation_qrs(self):
         """Scan for validation QR codes in ssi_validations_qr_codes folder"""
@@ -704,17 +917,8 @@ class ShearwaterToSSI:
         self.validation_qr_files = []
         
         if os.path.exists(validation_dir):
-            # Get all PNG files sorted by modification time (newest first)
-            png_files = []
-            for filename in os.listdir(validation_dir):
-                if filename.lower().endswith('.png'):
-                    filepath = os.path.join(validation_dir, filename)
-                    mtime = os.path.getmtime(filepath)
-                    png_files.append((filename, mtime))
-            
-            # Sort by modification time (newest first)
-            png_files.sort(key=lambda x: x[1], reverse=True)
-            self.validation_qr_files = [f[0] for f in png_files]
+            # Sorted by modification time (newest first)
+            self.validation_qr_files = [f[0] for f in self.cached_png_listing(validation_dir)]
             
             # Update combo box
             self.validation_combo['values'] = self.validation_qr_files
@@ -723,6 +927,15 @@ class ShearwaterToSSI:
                 # Set to latest file
                 self.validation_combo.set(self.validation_qr_files[0])
     
+    def cached_png_listing(self, directory):
+        """PNG files of a directory, newest first, cached until the directory changes"""
+        listing = self.logbook_cache.get(directory)
+        if listing is None:
+            signature = LogbookCache.signature(directory)
+            listing = list_png_files(directory)
+            self.logbook_cache.put(directory, listing, signature)
+        return listing
+    
     def on_validation_selected(self, event):
         """Handle validation QR selection from dropdown"""
         if self.qr_display_mode == 'validations':
@@ -798,29 +1011,11 @@ class ShearwaterToSSI:
         self.existing_dive_qr_codes = []
         
         if os.path.exists(dive_qr_dir):
-            # Get all PNG files sorted by modification time (newest first)
-            png_files = []
-            for filename in os.listdir(dive_qr_dir):
-                if filename.lower().endswith('.png'):
-                    filepath = os.path.join(dive_qr_dir, filename)
-                    mtime = os.path.getmtime(filepath)
-                    png_files.append((filename, filepath, mtime))
-            
-            # Sort by modification time (newest first)
-            png_files.sort(key=lambda x: x[2], reverse=True)
-            
-            # Load images
-            for filename, filepath, mtime in png_files:
-                try:
-                    img = Image.open(filepath)
-                    self.existing_dive_qr_codes.append({
-                        'image': img,
-                        'filename': filename,
-                        'type': 'existing_dive',
-                        'path': filepath
-                    })
-                except Exception as e:
-                    print(f"Could not load {filename}: {e}")
+            # Only the listing is cached; images are read when displayed (see qr_image)
+            self.existing_dive_qr_codes = [
+                {'filename': filename, 'type': 'existing_dive', 'path': filepath}
+                for filename, filepath, mtime in self.cached_png_listing(dive_qr_dir)
+            ]
         
         # Update existing QR count label
         if hasattr(self, 'existing_qr_label'):
@@ -849,6 +1044,7 @@ class ShearwaterToSSI:
                 except Exception as e:
                     print(f"Could not delete {qr['filename']}: {e}")
             
+            ssi_profiles.prune_profiles(os.path.dirname(self.existing_dive_qr_codes[0]['path']))
             self.existing_dive_qr_codes = []
             self.existing_qr_label.config(text="No existing QRs")
             
@@ -898,13 +1094,19 @@ class ShearwaterToSSI:
             else:
                 text = "No generated QR codes available"
             self.qr_display.configure(image='', text=text)
+            self.profile_display.configure(image='')
             self.qr_info_label.config(text="No QR codes")
             return
         
         qr_data = qr_list[self.current_qr_index]
         
         # Resize QR code for display
-        img = qr_data['image']
+        try:
+            img = self.qr_image(qr_data)
+        except OSError as e:
+            self.qr_display.configure(image='', text=f"Could not load {qr_data['filename']}: {e}")
+            self.profile_display.configure(image='')
+            return
         img_resized = img.resize((300, 300), Image.Resampling.NEAREST)
         
         # Convert to PhotoImage
@@ -914,6 +1116,11 @@ class ShearwaterToSSI:
         self.qr_display.configure(image=photo, text="")
         self.qr_display.image = photo  # Keep a reference
         
+        profile = self.qr_profile(qr_data)
+        profile_photo = ImageTk.PhotoImage(profile) if profile is not None else ''
+        self.profile_display.configure(image=profile_photo)
+        self.profile_display.image = profile_photo
+        
         # Update info label based on QR type
         if self.qr_display_mode == 'validations':
             qr_list = self.validation_qr_codes
@@ -933,6 +1140,75 @@ class ShearwaterToSSI:
                 info_text += f"Entry: {qr_data['entry']}, Depth: {qr_data['depth']}, Duration: {qr_data['duration']}"
         self.qr_info_label.config(text=info_text)
     
+    @staticmethod
+    def qr_image(qr_data):
+        """Image of a QR entry; QR files on disk are read each time they are shown"""
+        if 'image' in qr_data:
+            return qr_data['image']
+        return load_image(qr_data['path'])
+    
+    @staticmethod
+    def profile_path(qr_data):
+        directory, filename = os.path.split(qr_data['path'])
+        return os.path.join(directory, ssi_profiles.PROFILE_DIR, filename)
+    
+    def qr_profile(self, qr_data):
+        """Dive profile sparkline of a QR entry; existing QR files use the thumbnail cached beside them"""
+        if qr_data.get('type') == 'existing_dive':
+            try:
+                return load_image(self.profile_path(qr_data))
+            except OSError:
+                return None
+        return qr_data.get('profile')
+    
+    def start_scan_mode(self):
+        """Open the full-screen scan mode for the QR codes of the current display mode"""
+        if self.qr_display_mode == 'validations':
+            qr_list = self.validation_qr_codes
+        elif self.qr_display_mode == 'existing_dives':
+            qr_list = self.existing_dive_qr_codes
+        else:
+            qr_list = self.generated_qr_codes
+        
+        if not qr_list:
+            messagebox.showinfo("Info", "No QR codes to scan in the current display mode")
+            return
+        
+        validation_frame = None
+        if self.scan_interleave_var.get() and self.qr_display_mode != 'validations':
+            selected = self.validation_combo.get()
+            base_dir = os.path.dirname(self.db_path) if self.db_path else os.path.dirname(os.path.abspath(__file__))
+            filepath = os.path.join(base_dir, "ssi_validations_qr_codes", selected)
+            if not selected or not os.path.exists(filepath):
+                messagebox.showwarning("No Validation QR", "Select a validation QR code to interleave")
+                return
+            validation_frame = {'image': Image.open(filepath), 'caption': f"Validation: {selected}"}
+        
+        frames = []
+        for qr_data in qr_list:
+            if 'site' in qr_data:
+                caption = f"{qr_data.get('date', '')}  {qr_data['site']}  {qr_data['depth']}  {qr_data['duration']}"
+            else:
+                caption = qr_data.get('filename', '')
+            if 'image' in qr_data:
+                frame = {'image': qr_data['image'], 'caption': caption}
+            else:
+                # Read when the frame comes up, so a long session does not load every file at once
+                frame = {'path': qr_data['path'], 'caption': caption}
+            if qr_data.get('profile') is not None:
+                frame['profile'] = qr_data['profile']
+            elif qr_data.get('type') == 'existing_dive' and os.path.exists(self.profile_path(qr_data)):
+                frame['profile_path'] = self.profile_path(qr_data)
+            frames.append(frame)
+            if validation_frame:
+                frames.append(validation_frame)
+        
+        try:
+            interval = float(self.scan_interval_var.get())
+        except ValueError:
+            interval = 0
+        ScanKiosk(self.root, frames, interval_ms=int(interval * 1000) or 4000, auto_advance=interval > 0)
+    
     def show_previous_qr(self):
         """Show the previous QR code"""
         if self.current_qr_index > 0:
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Shearwater to SSI Batch Runner
+Generates QR code sets for many divers in one parallel run from a job manifest
+
+Usage:
+    python ssi_batch.py jobs.json [--workers N]
+
+See the "Batch Jobs" section of README.md for the manifest format.
+
+DISCLAIMER: This software is for DEMONSTRATION AND EDUCATIONAL PURPOSES ONLY.
+Not affiliated with Shearwater Research Inc., SSI, or any diving organization.
+USE AT YOUR OWN RISK. See DISCLAIMER.md for full legal disclaimer.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ssi_core import (
+    NO_SITE_LABEL, build_ssi_payload, dive_qr_filename, iter_dive_rows,
+    load_site_catalog, qr_version_summary, sync_qr_files
+)
+from ssi_export import EXPORT_FORMATS, open_dive_writer
+
+
+DEFAULT_ENTRY_TYPE = 'Boat (22)'
+
+
+def dive_matches_filters(dive_data, filters):
+    """Check a dive_details row against manifest filters (all given filters must match)"""
+    if not filters:
+        return True
+    dive_id, dive_date, depth, duration, site, location = dive_data[:6]
+
+    if filters.get('dive_ids') and str(dive_id) not in {str(i) for i in filters['dive_ids']}:
+        return False
+
+    day = (dive_date or '')[:10]
+    if filters.get('date_from') and (not day or day < filters['date_from']):
+        return False
+    if filters.get('date_to') and (not day or day > filters['date_to']):
+        return False
+
+    depth_m = float(depth) if depth else 0.0
+    if filters.get('min_depth') is not None and depth_m < float(filters['min_depth']):
+        return False
+    if filters.get('max_depth') is not None and depth_m > float(filters['max_depth']):
+        return False
+
+    duration_min = float(duration) / 60.0 if duration else 0.0
+    if filters.get('min_duration') is not None and duration_min < float(filters['min_duration']):
+        return False
+
+    if filters.get('site') and filters['site'].lower() not in (site or '').lower():
+        return False
+    if filters.get('location') and filters['location'].lower() not in (location or '').lower():
+        return False
+    return True
+
+
+def assign_site(dive_data, site_rules, default_site='0', default_entry=DEFAULT_ENTRY_TYPE):
+    """Return (site_id, entry_type) from the first site rule matching the dive.
+
+    A rule matches when every key of its "match" dict is a case-insensitive
+    substring of the Shearwater Site/Location field (or lists the dive ID).
+    """
+    dive_id, site, location = dive_data[0], dive_data[4], dive_data[5]
+    for rule in site_rules or []:
+        match = rule.get('match', {})
+        if 'site' in match and match['site'].lower() not in (site or '').lower():
+            continue
+        if 'location' in match and match['location'].lower() not in (location or '').lower():
+            continue
+        if 'dive_ids' in match and str(dive_id) not in {str(i) for i in match['dive_ids']}:
+            continue
+        return rule.get('ssi_site', default_site), rule.get('entry_type', default_entry)
+    return default_site, default_entry
+
+
+def resolve_site_ref(ref, catalog):
+    """Resolve a manifest site reference (exact name, ID or 'name (id)' label) to a site ID.
+
+    IDs must be in the catalog; anything unresolved falls back to No Site with
+    a warning.
+    """
+    if not ref or str(ref).strip() in ('0', NO_SITE_LABEL):
+        return '0'
+    site_id = catalog.find(ref)
+    if site_id is not None:
+        return site_id
+    print(f"Warning: unknown dive site '{ref}', using {NO_SITE_LABEL}")
+    return '0'
+
+
+def safe_dirname(name):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('_') or 'diver'
+
+
+def load_manifest(manifest_path, catalog):
+    """Read a manifest and return fully resolved job dicts ready for the workers"""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    output_dir = os.path.join(base_dir, manifest.get('output_dir', 'batch_qr_codes'))
+
+    def resolve_rules(rules):
+        return [dict(rule, ssi_site=resolve_site_ref(rule.get('ssi_site'), catalog)) for rule in rules]
+
+    shared_rules = resolve_rules(manifest.get('site_rules', []))
+    jobs = []
+    used_dirs = set()
+    for i, job in enumerate(manifest.get('jobs', [])):
+        name = job.get('name') or f"job_{i + 1:02d}"
+        # Jobs must never share a directory: reconciling one would delete the other's QR codes.
+        # Compared case-insensitively, as on Windows and macOS file systems.
+        dirname = base = safe_dirname(name)
+        suffix = 2
+        while dirname.lower() in used_dirs:
+            dirname = f"{base}_{suffix}"
+            suffix += 1
+        used_dirs.add(dirname.lower())
+        entry_type = job.get('entry_type', manifest.get('entry_type', DEFAULT_ENTRY_TYPE))
+        # Job rules take precedence over rules shared by all jobs
+        rules = [
+            {
+                'match': rule.get('match', {}),
+                'ssi_site': rule['ssi_site'],
+                'entry_type': rule.get('entry_type', entry_type)
+            }
+            for rule in resolve_rules(job.get('site_rules', [])) + shared_rules
+        ]
+        default_site = resolve_site_ref(job.get('default_site', manifest.get('default_site', '0')), catalog)
+        used_sites = {rule['ssi_site'] for rule in rules} | {default_site}
+        export = job.get('export', manifest.get('export', []))
+        for export_format in export:
+            if export_format not in EXPORT_FORMATS:
+                raise ValueError(f"Job {name}: unsupported export format '{export_format}'")
+        jobs.append({
+            'name': name,
+            'databases': [os.path.join(base_dir, db) for db in job.get('databases', [])],
+            'buddy': job.get('buddy', {}),
+            'filters': dict(manifest.get('filters', {}), **job.get('filters', {})),
+            'site_rules': rules,
+            'default_site': default_site,
+            'entry_type': entry_type,
+            'site_names': {s: catalog.sites[s]['name'] for s in used_sites if s in catalog.sites},
+            'site_coords': {s: (catalog.sites[s]['lat'], catalog.sites[s]['lng']) for s in used_sites if s in catalog.sites},
+            'export': export,
+            'qr': True,
+            'compact': bool(job.get('compact', manifest.get('compact', False))),
+            'output_dir': os.path.join(output_dir, dirname)
+        })
+    return jobs, output_dir
+
+
+def run_job(job):
+    """Generate all QR codes of one diver job; runs in a worker process"""
+    start = time.perf_counter()
+    stats = {
+        'name': job['name'],
+        'output_dir': job['output_dir'],
+        'dives_read': 0,
+        'dives_selected': 0,
+        'qr_written': 0,
+        'unchanged': 0,
+        'removed': 0,
+        'duplicates': 0,
+        'exported': 0,
+        'qr_versions': '',
+        'errors': []
+    }
+    firstname = job['buddy'].get('firstname', '') or 'Unknown'
+    lastname = job['buddy'].get('lastname', '') or 'Unknown'
+    user_id = job['buddy'].get('master_id', '') or '0'
+    os.makedirs(job['output_dir'], exist_ok=True)
+
+    # Exports are written while streaming the dives, in the same pass as the QR payloads
+    writers = [
+        open_dive_writer(os.path.join(job['output_dir'], f"logbook.{export_format}"),
+                         job['site_names'], job['site_coords'], export_format)
+        for export_format in job['export']
+    ]
+    entries = []
+    standard_payloads = []  # only kept in compact mode, to report the version gain
+    taken = set()
+    try:
+        for db_path in job['databases']:
+            if not os.path.exists(db_path):
+                stats['errors'].append(f"{db_path}: database not found")
+                continue
+            try:
+                for dive_data in iter_dive_rows(db_path):
+                    stats['dives_read'] += 1
+                    if not dive_matches_filters(dive_data, job['filters']):
+                        continue
+                    stats['dives_selected'] += 1
+                    filename, _ = dive_qr_filename(dive_data[1], len(taken), dive_data[0])
+                    # Merged exports of the same logbook contain the same dives
+                    if filename in taken:
+                        stats['duplicates'] += 1
+                        continue
+                    taken.add(filename)
+                    site_id, entry_type = assign_site(dive_data, job['site_rules'], job['default_site'], job['entry_type'])
+                    for writer in writers:
+                        writer.write(dive_data, site_id, entry_type)
+                    if job['qr']:
+                        payload = build_ssi_payload(dive_data, firstname, lastname, user_id, site_id, entry_type,
+                                                    job['compact'])
+                        entries.append({'filename': filename, 'payload': payload})
+                        if job['compact']:
+                            standard_payloads.append(build_ssi_payload(dive_data, firstname, lastname, user_id,
+                                                                       site_id, entry_type))
+            except Exception as e:
+                stats['errors'].append(f"{db_path}: {e}")
+    finally:
+        for writer in writers:
+            writer.close()
+    stats['exported'] = len(taken) if writers else 0
+
+    if job['qr']:
+        # Each job owns its directory, so a re-run only rewrites changed QRs and drops stale ones
+        if not stats['errors']:
+            sync_stats = sync_qr_files(job['output_dir'], entries, remove_orphans=True, compact=job['compact'])
+        else:
+            sync_stats = sync_qr_files(job['output_dir'], entries, compact=job['compact'])
+        stats['qr_versions'] = qr_version_summary([entry['payload'] for entry in entries], job['compact'])
+        if job['compact']:
+            stats['standard_qr_versions'] = qr_version_summary(standard_payloads)
+        stats['qr_written'] = sync_stats['written']
+        stats['unchanged'] = sync_stats['unchanged']
+        stats['removed'] = sync_stats['removed']
+
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def run_batch(jobs, workers=None):
+    """Run all jobs in parallel and return their stats in manifest order"""
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                results[i] = {'name': jobs[i]['name'], 'output_dir': jobs[i]['output_dir'],
+                              'dives_read': 0, 'dives_selected': 0, 'qr_written': 0, 'unchanged': 0,
+                              'removed': 0, 'duplicates': 0, 'exported': 0, 'qr_versions': '',
+                              'errors': [str(e)], 'seconds': 0.0}
+            print(f"Finished {results[i]['name']}: {results[i]['qr_written']} QR codes written")
+    return [results[i] for i in range(len(jobs))]
+
+
+def write_summary(output_dir, results, elapsed):
+    """Print the batch summary and save it as batch_summary.json"""
+    summary = {
+        'finished': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'seconds': round(elapsed, 3),
+        'jobs': results,
+        'totals': {
+            key: sum(r[key] for r in results)
+            for key in ('dives_read', 'dives_selected', 'qr_written', 'unchanged', 'removed', 'duplicates', 'exported')
+        }
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    summary_path = os.path.join(output_dir, 'batch_summary.json')
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n{'Job':<24}{'Read':>8}{'Selected':>10}{'Written':>9}{'Same':>7}{'Removed':>9}{'Dupes':>7}{'Seconds':>9}")
+    for r in results:
+        print(f"{r['name']:<24}{r['dives_read']:>8}{r['dives_selected']:>10}{r['qr_written']:>9}"
+              f"{r['unchanged']:>7}{r['removed']:>9}{r['duplicates']:>7}{r['seconds']:>9.2f}")
+        if r['qr_versions']:
+            gain = f" (standard payload: {r['standard_qr_versions']})" if r.get('standard_qr_versions') else ''
+            print(f"  QR versions: {r['qr_versions']}{gain}")
+        for error in r['errors']:
+            print(f"  Error: {error}")
+    totals = summary['totals']
+    print(f"{'Total':<24}{totals['dives_read']:>8}{totals['dives_selected']:>10}{totals['qr_written']:>9}"
+          f"{totals['unchanged']:>7}{totals['removed']:>9}{totals['duplicates']:>7}{elapsed:>9.2f}")
+    if totals['exported']:
+        print(f"Exported {totals['exported']} dives to logbook files in the job directories")
+    print(f"\nSummary saved to {summary_path}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate SSI QR codes for many divers from a job manifest")
+    parser.add_argument('manifest', help="Job manifest JSON file")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--no-qr', action='store_true', help="Only run the exports listed in the manifest")
+    args = parser.parse_args(argv)
+
+    catalog = load_site_catalog()
+    jobs, output_dir = load_manifest(args.manifest, catalog)
+    if not jobs:
+        print("No jobs in manifest")
+        return 1
+    if args.no_qr:
+        for job in jobs:
+            job['qr'] = False
+
+    start = time.perf_counter()
+    results = run_batch(jobs, args.workers)
+    write_summary(output_dir, results, time.perf_counter() - start)
+    return 1 if any(r['errors'] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
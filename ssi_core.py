@@ -0,0 +1,757 @@
+#!/usr/bin/env python3
+"""
+Shearwater to SSI Core
+Dive site catalog, payload, QR code and file helpers shared by the GUI and the command line tools
+
+This module does not import tkinter, so ssi_batch.py, ssi_export.py and the other
+command line tools also run on Python builds without Tk, as on most servers and
+containers. The GUI in shearwater2ssi.py imports everything it needs from here.
+
+DISCLAIMER: This software is for DEMONSTRATION AND EDUCATIONAL PURPOSES ONLY.
+Not affiliated with Shearwater Research Inc., SSI, or any diving organization.
+USE AT YOUR OWN RISK. See DISCLAIMER.md for full legal disclaimer.
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from collections import OrderedDict
+from datetime import datetime
+
+import qrcode
+from PIL import Image
+
+import ssi_qr_encoder
+
+
+SITES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ssi_dive_sites')
+NO_SITE_LABEL = "No Site (0)"
+ALL_REGIONS = "All Regions"
+
+
+COMPACT_SITES_FORMAT = "ssi-sites-compact-1"
+
+
+# Start of a site's properties object in a raw API response: elements[].data.properties
+SITE_PROPERTIES_PATTERN = re.compile(rb'"data"\s*:\s*\{\s*"properties"\s*:\s*\{')
+STREAM_CHUNK = 1024 * 1024
+STREAM_WINDOW = 16 * 1024
+
+
+def _site_from_properties(props):
+    site_id = props.get('id', '')
+    site_name = props.get('name', '')
+    if site_id and site_name:
+        return {
+            'id': str(site_id),
+            'name': site_name,
+            'lat': props.get('lat', ''),
+            'lng': props.get('lng', '')
+        }
+    return None
+
+
+def iter_streamed_site_properties(f, chunk_size=STREAM_CHUNK):
+    """Yield the properties dict of each site in a raw API response file.
+    
+    The binary file is read in chunks and scanned for the start of each
+    properties object; only that object is decoded, from a window that grows
+    until it holds the whole object. Memory use is bounded by the chunk size
+    and the largest single site, not by the size of the file.
+    """
+    decoder = json.JSONDecoder()
+    buf = b''
+    pos = 0
+    eof = False
+    
+    while True:
+        match = SITE_PROPERTIES_PATTERN.search(buf, pos)
+        if match:
+            start = match.end() - 1
+            window = STREAM_WINDOW
+            while True:
+                # A multi-byte character cut at the window end is dropped; the
+                # object then just looks truncated and the window grows
+                text = buf[start:start + window].decode('utf-8', errors='ignore')
+                try:
+                    props, length = decoder.raw_decode(text)
+                    break
+                except ValueError:
+                    if start + window < len(buf):
+                        window *= 4
+                        continue
+                    props = None
+                    break
+            if props is not None:
+                pos = start + len(text[:length].encode('utf-8'))
+                if isinstance(props, dict):
+                    yield props
+                continue
+            if eof:
+                return  # truncated capture
+            # Object continues in the next chunk: keep it from its start
+            buf = buf[match.start():]
+            pos = 0
+        elif eof:
+            return
+        else:
+            # Keep a short tail in case the next pattern is split across chunks
+            buf = buf[max(pos, len(buf) - 256):]
+            pos = 0
+        
+        data = f.read(chunk_size)
+        if data:
+            buf += data
+        else:
+            eof = True
+
+
+def iter_response_sites(f):
+    """Yield site dicts (id, name, lat, lng) from a raw API response in a binary file object"""
+    for props in iter_streamed_site_properties(f):
+        site = _site_from_properties(props)
+        if site:
+            yield site
+
+
+def iter_region_sites(json_path):
+    """Yield site property dicts (id, name, lat, lng) from a region JSON file.
+    
+    Accepts both compact catalogs written by ssi_sites_ingest.py and raw
+    locationServices.php responses captured from the SSI website. Raw
+    responses are streamed in chunks, skipping images and statistics
+    instead of building the whole object tree.
+    """
+    with open(json_path, 'rb') as f:
+        head = f.read(256)
+        if not head.strip():
+            return
+        if COMPACT_SITES_FORMAT.encode('utf-8') in head:
+            f.seek(0)
+            data = json.loads(f.read().decode('utf-8'))
+            for site in data.get('sites', []):
+                site = _site_from_properties(site)
+                if site:
+                    yield site
+            return
+        
+        f.seek(0)
+        found = False
+        for site in iter_response_sites(f):
+            found = True
+            yield site
+    
+    if not found:
+        # Unusual layout (e.g. reordered keys): fall back to parsing the whole file
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if 'result' in data and 'elements' in data['result']:
+            for element in data['result']['elements']:
+                if 'data' in element and 'properties' in element['data']:
+                    site = _site_from_properties(element['data']['properties'])
+                    if site:
+                        yield site
+
+
+def find_region_files(sites_dir):
+    """Map region names to their JSON files in a dive sites directory, sorted by name"""
+    regions = {}
+    if os.path.exists(sites_dir):
+        for filename in os.listdir(sites_dir):
+            if filename.lower().endswith('.json'):
+                region_name = os.path.splitext(filename)[0]
+                region_name = region_name.replace('_', ' ').title()
+                regions[region_name] = os.path.join(sites_dir, filename)
+    return dict(sorted(regions.items()))
+
+
+class DiveSiteCatalog:
+    """Merged dive site catalog across all region files, indexed by ID, name prefix and region"""
+
+    def __init__(self):
+        self.sites = {}  # site_id -> {'id', 'name', 'lat', 'lng', 'regions'}
+        self.regions = {}  # region name -> sorted list of site labels
+        self._prefix_index = []  # sorted (search key, label) pairs for bisect lookups
+        self._name_index = {}  # lowercase site name -> site_id
+
+    @staticmethod
+    def make_label(name, site_id):
+        return f"{name} ({site_id})"
+
+    @staticmethod
+    def parse_label(label):
+        """Extract the site ID from a 'name (id)' label"""
+        if label and label.endswith(')') and '(' in label:
+            return label[label.rfind('(') + 1:-1].strip()
+        return None
+
+    def add_region(self, region_name, json_path):
+        """Merge all sites of a region file into the catalog, deduplicated by site ID"""
+        labels = set()
+        for props in iter_region_sites(json_path):
+            site = self.sites.get(props['id'])
+            if site is None:
+                site = dict(props, regions=[])
+                self.sites[props['id']] = site
+            if region_name not in site['regions']:
+                site['regions'].append(region_name)
+            labels.add(self.make_label(site['name'], site['id']))
+        self.regions[region_name] = sorted(labels)
+        self._prefix_index = []
+        self._name_index = {}
+        return len(labels)
+
+    def label(self, site_id):
+        site = self.sites.get(str(site_id))
+        if site is None:
+            return NO_SITE_LABEL
+        return self.make_label(site['name'], site['id'])
+
+    def labels(self, region_name=None):
+        """Sorted site labels for a region, or for the whole catalog"""
+        if region_name and region_name != ALL_REGIONS:
+            return list(self.regions.get(region_name, []))
+        return sorted(self.make_label(s['name'], s['id']) for s in self.sites.values())
+
+    def find(self, ref):
+        """Known site ID for an exact site name, bare ID or 'name (id)' label, None if unknown.
+
+        Names are tried first, as many site names end in parentheses themselves
+        ("Barcadera (21)"); a reference is only split into name and ID last.
+        """
+        if not ref:
+            return None
+        ref = str(ref).strip()
+        if not self._name_index:
+            for site in self.sites.values():
+                self._name_index.setdefault(site['name'].lower(), site['id'])
+        if ref.lower() in self._name_index:
+            return self._name_index[ref.lower()]
+        if ref in self.sites:
+            return ref
+        site_id = self.parse_label(ref)
+        return site_id if site_id in self.sites else None
+
+    def resolve(self, label_or_id):
+        """Resolve a site label, name or bare ID to a known site ID, '0' if unknown"""
+        return self.find(label_or_id) or "0"
+
+    def _build_prefix_index(self):
+        # Index the full name and every word of it, so "pier" finds "Salt Pier"
+        entries = set()
+        for site in self.sites.values():
+            label = self.make_label(site['name'], site['id'])
+            name = site['name'].lower()
+            entries.add((name, label))
+            for word in name.split()[1:]:
+                entries.add((word, label))
+            entries.add((site['id'], label))
+        self._prefix_index = sorted(entries)
+
+    def search(self, text, region_name=None, limit=200):
+        """Return sorted labels whose name, any word of the name, or ID starts with text"""
+        text = (text or '').strip().lower()
+        if not text:
+            return self.labels(region_name)[:limit]
+        if not self._prefix_index:
+            self._build_prefix_index()
+
+        in_region = None
+        if region_name and region_name != ALL_REGIONS:
+            in_region = set(self.regions.get(region_name, []))
+
+        matches = set()
+        start = bisect.bisect_left(self._prefix_index, (text, ''))
+        for key, label in self._prefix_index[start:]:
+            if not key.startswith(text):
+                break
+            if in_region is None or label in in_region:
+                matches.add(label)
+        return sorted(matches)[:limit]
+
+    def __len__(self):
+        return len(self.sites)
+
+
+def load_site_catalog(sites_dir=SITES_DIR):
+    """Build a catalog from every region file in a dive sites directory"""
+    catalog = DiveSiteCatalog()
+    for region_name, json_path in find_region_files(sites_dir).items():
+        try:
+            catalog.add_region(region_name, json_path)
+        except Exception as e:
+            print(f"Could not load dive sites from {region_name}: {e}")
+    return catalog
+
+
+DIVE_DETAILS_QUERY = """
+SELECT DiveId, DiveDate, Depth, DiveLengthTime, Site, Location,
+       AverageDepth, AverageTemp, Weather, Visibility
+FROM dive_details
+ORDER BY DiveDate DESC
+"""
+
+
+def load_dive_rows(db_path):
+    """Load all dives from a Shearwater database, newest first"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(DIVE_DETAILS_QUERY).fetchall()
+    finally:
+        conn.close()
+
+
+def iter_dive_rows(db_path, batch_size=500):
+    """Stream dives from a Shearwater database, newest first, without loading them all"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute(DIVE_DETAILS_QUERY)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+def dive_qr_filename(dive_date, index, dive_id=None):
+    """Return the QR filename and display date for a dive.
+    
+    Dives without a usable date are named after their DiveId, so the name
+    stays the same across runs; the index is only used when there is no ID.
+    """
+    if dive_date:
+        try:
+            dt = datetime.strptime(dive_date, "%Y-%m-%d %H:%M:%S")
+            return f"dive_{dt.strftime('%Y%m%d_%H%M%S')}.png", dt.strftime('%Y-%m-%d %H:%M')
+        except:
+            pass
+    if dive_id not in (None, ''):
+        safe_id = ''.join(c if c.isalnum() or c in '-_' else '_' for c in str(dive_id))
+        return f"dive_id_{safe_id}.png", f"Dive {index + 1}"
+    return f"dive_{index:03d}.png", f"Dive {index + 1}"
+
+
+def unique_qr_filename(filename, dive_id, taken):
+    """Disambiguate dives sharing a start time by appending the DiveId"""
+    if filename not in taken:
+        return filename
+    base, ext = os.path.splitext(filename)
+    candidate = f"{base}_{dive_id}{ext}"
+    n = 2
+    while candidate in taken:
+        candidate = f"{base}_{dive_id}_{n}{ext}"
+        n += 1
+    return candidate
+
+
+def normalize_dive(dive_data):
+    """Convert a dive_details row to the units and defaults used in SSI payloads"""
+    dive_id, dive_date, depth, duration, site, location, avg_depth, avg_temp, weather, visibility = dive_data
+    
+    dt = None
+    if dive_date:
+        try:
+            dt = datetime.strptime(dive_date, "%Y-%m-%d %H:%M:%S")
+        except:
+            dt = None
+    
+    return {
+        'dive_id': dive_id,
+        'datetime': dt,
+        'datetime_str': dt.strftime("%Y%m%d%H%M") if dt else "202501010000",
+        'depth_m': float(depth) if depth else 0.0,
+        'divetime_min': float(duration) / 60.0 if duration else 0.0,
+        'avg_depth_m': float(avg_depth) if avg_depth else 0.0,
+        'airtemp_c': float(avg_temp) if avg_temp else 0.0,
+        'vis_m': float(visibility) if visibility else 0.0,
+        'shearwater_site': site or '',
+        'shearwater_location': location or ''
+    }
+
+
+def entry_type_id(entry_type):
+    return "21" if "Shore" in entry_type else "22"
+
+
+def build_ssi_payload(dive_data, firstname, lastname, user_id, site_code, entry_type, compact=False):
+    """Build the SSI dive QR payload for a dive_details row.
+    
+    With compact, the repeated var_divetype_id field, the empty leader ID and
+    unknown (zero) air temperature and visibility are left out, which usually
+    saves one or two QR versions.
+    """
+    dive = normalize_dive(dive_data)
+    
+    var_entry_id = entry_type_id(entry_type)
+    
+    var_weather_id = "1"
+    var_water_body_id = "13"
+    var_watertype_id = "5"
+    var_current_id = "6"
+    var_surface_id = "10"
+    var_divetype_id = "24"
+    
+    if compact:
+        fields = [
+            "dive;noid",
+            "dive_type:0",
+            f"divetime:{dive['divetime_min']:.1f}",
+            f"datetime:{dive['datetime_str']}",
+            f"depth_m:{dive['depth_m']:.1f}",
+            f"site:{site_code}",
+            f"var_weather_id:{var_weather_id}",
+            f"var_entry_id:{var_entry_id}",
+            f"var_water_body_id:{var_water_body_id}",
+            f"var_watertype_id:{var_watertype_id}",
+            f"var_current_id:{var_current_id}",
+            f"var_surface_id:{var_surface_id}",
+            f"var_divetype_id:{var_divetype_id}",
+            f"user_master_id:{user_id}",
+            f"user_firstname:{firstname}",
+            f"user_lastname:{lastname}"
+        ]
+        if dive['airtemp_c']:
+            fields.append(f"airtemp_c:{dive['airtemp_c']:.1f}")
+        if dive['vis_m']:
+            fields.append(f"vis_m:{dive['vis_m']:.1f}")
+        return ';'.join(fields)
+    
+    payload = (
+        f"dive;noid;"
+        f"dive_type:0;"
+        f"divetime:{dive['divetime_min']:.1f};"
+        f"datetime:{dive['datetime_str']};"
+        f"depth_m:{dive['depth_m']:.1f};"
+        f"site:{site_code};"
+        f"var_weather_id:{var_weather_id};"
+        f"var_entry_id:{var_entry_id};"
+        f"var_water_body_id:{var_water_body_id};"
+        f"var_watertype_id:{var_watertype_id};"
+        f"var_current_id:{var_current_id};"
+        f"var_surface_id:{var_surface_id};"
+        f"var_divetype_id:{var_divetype_id};"
+        f"var_divetype_id:{var_divetype_id};"
+        f"user_master_id:{user_id};"
+        f"user_firstname:{firstname};"
+        f"user_lastname:{lastname};"
+        f"user_leader_id:;"
+        f"airtemp_c:{dive['airtemp_c']:.1f};"
+        f"vis_m:{dive['vis_m']:.1f}"
+    )
+    
+    return payload
+
+
+# Error correction levels from strongest to weakest
+QR_EC_LEVELS = [
+    ('H', qrcode.constants.ERROR_CORRECT_H),
+    ('Q', qrcode.constants.ERROR_CORRECT_Q),
+    ('M', qrcode.constants.ERROR_CORRECT_M),
+    ('L', qrcode.constants.ERROR_CORRECT_L),
+]
+
+
+def plan_qr_symbol(payload):
+    """Return (version, error_correction) for a single byte-mode segment.
+    
+    Picks the smallest version that holds the payload at level L, then the
+    strongest error correction that still fits in that version, so the symbol
+    is as small as possible and as robust as that size allows.
+    """
+    data_bits = 8 * len(payload.encode('utf-8'))
+    
+    def needed_bits(version):
+        return 4 + qrcode.util.mode_sizes_for_version(version)[qrcode.util.MODE_8BIT_BYTE] + data_bits
+    
+    limits_l = qrcode.util.BIT_LIMIT_TABLE[qrcode.constants.ERROR_CORRECT_L]
+    for version in range(1, 41):
+        if needed_bits(version) <= limits_l[version]:
+            break
+    else:
+        raise qrcode.exceptions.DataOverflowError()
+    
+    for _, error_correction in QR_EC_LEVELS:
+        if needed_bits(version) <= qrcode.util.BIT_LIMIT_TABLE[error_correction][version]:
+            return version, error_correction
+    return version, qrcode.constants.ERROR_CORRECT_L
+
+
+def standard_qr_version(payload):
+    """QR version the default path (level L, automatic fit) uses for a payload"""
+    segments = ssi_qr_encoder.segment_data(payload)
+    return ssi_qr_encoder.fit_version(segments, qrcode.constants.ERROR_CORRECT_L)
+
+
+# Both engines produce identical symbols (see ssi_qr_encoder.py); 'fast' needs NumPy
+QR_ENGINES = ('fast', 'qrcode')
+DEFAULT_QR_ENGINE = 'fast' if ssi_qr_encoder.AVAILABLE else 'qrcode'
+
+
+def make_qr_image(payload, compact=False, engine=None):
+    """Render a payload as a QR code image.
+    
+    The default path lets qrcode find the version at level L. With compact,
+    the version and error correction come from plan_qr_symbol and the payload
+    is encoded as one byte segment, so no fitting is done at render time.
+    """
+    engine = engine or DEFAULT_QR_ENGINE
+    if engine not in QR_ENGINES:
+        raise ValueError(f"Unknown QR engine '{engine}', use one of: {', '.join(QR_ENGINES)}")
+    if compact:
+        version, error_correction = plan_qr_symbol(payload)
+        if engine == 'fast':
+            matrix = ssi_qr_encoder.qr_matrix(payload.encode('utf-8'), version, error_correction,
+                                              mode=qrcode.util.MODE_8BIT_BYTE)
+            return ssi_qr_encoder.matrix_image(matrix, box_size=10, border=4)
+        qr = qrcode.QRCode(
+            version=version,
+            error_correction=error_correction,
+            box_size=10,
+            border=4,
+        )
+        qr.add_data(qrcode.util.QRData(payload.encode('utf-8'), mode=qrcode.util.MODE_8BIT_BYTE))
+        qr.make(fit=False)
+    elif engine == 'fast':
+        return ssi_qr_encoder.matrix_image(ssi_qr_encoder.qr_matrix(payload), box_size=10, border=4)
+    else:
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=10,
+            border=4,
+        )
+        qr.add_data(payload)
+        qr.make(fit=True)
+    
+    return qr.make_image(fill_color="black", back_color="white")
+
+
+def qr_version_summary(payloads, compact=False):
+    """Describe the QR versions used for a batch, e.g. 'v9 x120, v10 x3'"""
+    versions = {}
+    for payload in payloads:
+        version = plan_qr_symbol(payload)[0] if compact else standard_qr_version(payload)
+        versions[version] = versions.get(version, 0) + 1
+    return ', '.join(f"v{v} x{n}" for v, n in sorted(versions.items()))
+
+
+QR_OUTPUT_MODES = ['Replace all', 'Add to existing', 'Reconcile']
+QR_INDEX_FILE = '.qr_index.json'  # filename -> payload digest and source database of each QR written
+
+
+def payload_digest(payload, compact=False):
+    prefix = 'compact:' if compact else ''
+    return hashlib.sha1((prefix + payload).encode('utf-8')).hexdigest()
+
+
+def load_qr_index(output_dir):
+    try:
+        with open(os.path.join(output_dir, QR_INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Older indexes stored only the digest, without the source database
+    return {k: v if isinstance(v, dict) else {'digest': v, 'source': None} for k, v in index.items()}
+
+
+def atomic_write(filepath, write_func):
+    """Write a file through a temp file in the same directory and rename it into place"""
+    directory = os.path.dirname(filepath) or '.'
+    # Not named *.png, so an interrupted write is never listed as a QR code
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write_func(f)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def sync_qr_files(output_dir, entries, remove_orphans=False, compact=False, source=None):
+    """Bring a QR directory in line with the desired entries, touching only what changed.
+    
+    Each entry needs 'filename' and 'payload'. A file is rendered and written
+    (atomically) only if it is missing or its payload changed since it was
+    written; rendered images are stored in entry['image']. Written files are
+    recorded in the index with their source (the database path). With
+    remove_orphans, indexed files of the same source that are not among the
+    entries are deleted; files of other databases or not written by this tool
+    are left alone.
+    Returns counts of written, unchanged and removed files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    index = load_qr_index(output_dir)
+    existing = {f for f in os.listdir(output_dir) if f.lower().endswith('.png')}
+    stats = {'written': 0, 'unchanged': 0, 'removed': 0}
+    index_changed = False
+    
+    for entry in entries:
+        filename = entry['filename']
+        digest = payload_digest(entry['payload'], compact)
+        recorded = index.get(filename, {})
+        if filename in existing and recorded.get('digest') == digest:
+            stats['unchanged'] += 1
+            if recorded.get('source') != source:
+                index[filename] = {'digest': digest, 'source': source}
+                index_changed = True
+            continue
+        img = make_qr_image(entry['payload'], compact)
+        atomic_write(os.path.join(output_dir, filename), lambda f: img.save(f, format='PNG'))
+        entry['image'] = img
+        index[filename] = {'digest': digest, 'source': source}
+        stats['written'] += 1
+    
+    desired = {entry['filename'] for entry in entries}
+    if remove_orphans:
+        for filename in existing - desired:
+            if filename not in index or index[filename]['source'] != source:
+                continue
+            try:
+                os.remove(os.path.join(output_dir, filename))
+                stats['removed'] += 1
+                existing.discard(filename)
+            except OSError as e:
+                print(f"Could not delete {filename}: {e}")
+    index = {k: v for k, v in index.items() if k in existing or k in desired}
+    
+    index_missing = not os.path.exists(os.path.join(output_dir, QR_INDEX_FILE))
+    if stats['written'] or stats['removed'] or index_changed or index_missing:
+        atomic_write(os.path.join(output_dir, QR_INDEX_FILE),
+                     lambda f: f.write(json.dumps(index, indent=1, sort_keys=True).encode('utf-8')))
+    return stats
+
+
+LOGBOOK_CACHE_MB = 64
+
+
+def estimate_size(obj, sample=64):
+    """Approximate memory footprint of nested lists, tuples, dicts and scalars in bytes.
+    
+    Long containers are extrapolated from their first `sample` items, so a
+    logbook of 100,000 dives is sized in microseconds rather than seconds.
+    PIL images count with their decoded pixels.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, Image.Image):
+        return size + obj.width * obj.height * len(obj.getbands())
+    if isinstance(obj, (dict, list, tuple)) and obj:
+        items = obj.items() if isinstance(obj, dict) else obj
+        head = [item for _, item in zip(range(sample), items)]
+        if isinstance(obj, dict):
+            head_size = sum(estimate_size(k, sample) + estimate_size(v, sample) for k, v in head)
+        else:
+            head_size = sum(estimate_size(item, sample) for item in head)
+        size += head_size * len(obj) // len(head)
+    return size
+
+
+class LogbookCache:
+    """LRU cache of loaded logbook states, keyed by path and capped by memory.
+    
+    Each entry remembers the modification time and size of its file (or
+    directory) when it was stored; an entry whose file changed since is
+    dropped on lookup, so a re-exported database is read again.
+    """
+    
+    def __init__(self, max_bytes=LOGBOOK_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # path -> (signature, state, size), least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def signature(path):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    
+    def get(self, path):
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+        if entry is not None:
+            try:
+                current = self.signature(key)
+            except OSError:
+                current = None
+            if current == entry[0]:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.discard(key)
+        self.misses += 1
+        return None
+    
+    def put(self, path, state, signature=None):
+        """Store a state; signature should be taken before the state was read from disk"""
+        key = os.path.abspath(path)
+        self.discard(key)
+        try:
+            signature = signature or self.signature(key)
+        except OSError:
+            return
+        size = estimate_size(state)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (signature, state, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+    
+    def discard(self, path):
+        entry = self.entries.pop(os.path.abspath(path), None)
+        if entry is not None:
+            self.bytes -= entry[2]
+    
+    def __len__(self):
+        return len(self.entries)
+
+
+def dive_tree_columns(dive):
+    """Date, time, depth and duration columns of the dive list for a dive_details row"""
+    dive_date, depth, duration = dive[1], dive[2], dive[3]
+    if dive_date:
+        try:
+            dt = datetime.strptime(dive_date, "%Y-%m-%d %H:%M:%S")
+            date_str = dt.strftime("%Y-%m-%d")
+            time_str = dt.strftime("%H:%M")
+        except:
+            date_str = dive_date[:10] if len(dive_date) >= 10 else "N/A"
+            time_str = dive_date[11:16] if len(dive_date) >= 16 else "N/A"
+    else:
+        date_str = "N/A"
+        time_str = "N/A"
+    
+    depth_m = f"{float(depth):.1f}" if depth else "0.0"
+    duration_min = f"{int(duration)/60:.1f}" if duration else "0.0"
+    return (date_str, time_str, depth_m, duration_min)
+
+
+def list_png_files(directory):
+    """(filename, path, mtime) of the PNG files in a directory, newest first"""
+    png_files = []
+    if os.path.exists(directory):
+        for filename in os.listdir(directory):
+            if filename.lower().endswith('.png'):
+                filepath = os.path.join(directory, filename)
+                png_files.append((filename, filepath, os.path.getmtime(filepath)))
+    png_files.sort(key=lambda x: x[2], reverse=True)
+    return png_files
+
+
+def load_image(path):
+    """Read an image fully into memory, so no file handle stays open"""
+    with Image.open(path) as img:
+        img.load()
+        return img
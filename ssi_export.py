@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Shearwater Logbook Export
+Streams normalized dive data to CSV or UDDF, one dive at a time
+
+Usage:
+    python ssi_export.py shearwater_databases/logbook.db logbook.csv
+    python ssi_export.py shearwater_databases/logbook.db logbook.uddf --site 68089 --entry "Shore (21)"
+
+Batch manifests can export the same data per job with filters and site rules applied;
+see the "Batch Jobs" section of README.md.
+
+DISCLAIMER: This software is for DEMONSTRATION AND EDUCATIONAL PURPOSES ONLY.
+Not affiliated with Shearwater Research Inc., SSI, or any diving organization.
+USE AT YOUR OWN RISK. See DISCLAIMER.md for full legal disclaimer.
+"""
+
+import argparse
+import csv
+import os
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+from ssi_core import entry_type_id, iter_dive_rows, load_site_catalog, normalize_dive
+
+
+EXPORT_FORMATS = ('csv', 'uddf')
+
+CSV_COLUMNS = [
+    'dive_id', 'datetime', 'depth_m', 'duration_min', 'avg_depth_m', 'temp_c', 'visibility_m',
+    'ssi_site_id', 'ssi_site_name', 'entry_type', 'entry_id', 'shearwater_site', 'shearwater_location'
+]
+
+# UDDF platform values for the SSI entry types
+UDDF_PLATFORMS = {'21': 'beach-shore', '22': 'charter-boat'}
+
+
+class CsvDiveWriter:
+    """Write one CSV row per dive as it arrives"""
+
+    def __init__(self, path, site_names=None):
+        self.site_names = site_names or {}
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_COLUMNS)
+        self.count = 0
+
+    def write(self, dive_data, site_id, entry_type):
+        dive = normalize_dive(dive_data)
+        self.writer.writerow([
+            dive['dive_id'],
+            dive['datetime'].isoformat(sep=' ') if dive['datetime'] else '',
+            f"{dive['depth_m']:.1f}",
+            f"{dive['divetime_min']:.1f}",
+            f"{dive['avg_depth_m']:.1f}",
+            f"{dive['airtemp_c']:.1f}",
+            f"{dive['vis_m']:.1f}",
+            site_id,
+            self.site_names.get(str(site_id), ''),
+            entry_type,
+            entry_type_id(entry_type),
+            dive['shearwater_site'],
+            dive['shearwater_location']
+        ])
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+class UddfDiveWriter:
+    """Write a UDDF 3.2 document incrementally.
+
+    The divesite section has to come before the dives, so the sites that can
+    be referenced (site ID -> name) are passed in up front.
+    """
+
+    def __init__(self, path, site_names=None, site_coords=None):
+        self.site_names = {str(k): v for k, v in (site_names or {}).items() if str(k) != '0'}
+        self.file = open(path, 'w', encoding='utf-8')
+        self.count = 0
+        site_coords = site_coords or {}
+
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.file.write('<uddf xmlns="http://www.streit.cc/uddf/3.2/" version="3.2.0">\n')
+        self.file.write('  <generator>\n    <name>shearwater2ssi</name>\n    <type>converter</type>\n  </generator>\n')
+        if self.site_names:
+            self.file.write('  <divesite>\n')
+            for site_id, name in sorted(self.site_names.items()):
+                self.file.write(f'    <site id={quoteattr("site_" + site_id)}>\n')
+                self.file.write(f'      <name>{escape(name)}</name>\n')
+                lat, lng = site_coords.get(site_id, ('', ''))
+                if lat and lng:
+                    self.file.write(f'      <geography><latitude>{escape(str(lat))}</latitude>'
+                                    f'<longitude>{escape(str(lng))}</longitude></geography>\n')
+                self.file.write('    </site>\n')
+            self.file.write('  </divesite>\n')
+        self.file.write('  <profiledata>\n    <repetitiongroup id="rg_1">\n')
+
+    def write(self, dive_data, site_id, entry_type):
+        dive = normalize_dive(dive_data)
+        self.count += 1
+        # DiveIds can repeat across merged databases, so the XML id is sequential
+        out = [f'      <dive id="dive_{self.count}">\n',
+               '        <informationbeforedive>\n']
+        if str(site_id) in self.site_names:
+            out.append(f'          <link ref={quoteattr("site_" + str(site_id))}/>\n')
+        if dive['datetime']:
+            out.append(f'          <datetime>{dive["datetime"].isoformat()}</datetime>\n')
+        if dive['airtemp_c']:
+            # UDDF temperatures are in Kelvin
+            out.append(f'          <airtemperature>{dive["airtemp_c"] + 273.15:.2f}</airtemperature>\n')
+        out.append(f'          <platform>{UDDF_PLATFORMS[entry_type_id(entry_type)]}</platform>\n')
+        out.append('        </informationbeforedive>\n')
+        out.append('        <informationafterdive>\n')
+        out.append(f'          <greatestdepth>{dive["depth_m"]:.1f}</greatestdepth>\n')
+        if dive['avg_depth_m']:
+            out.append(f'          <averagedepth>{dive["avg_depth_m"]:.1f}</averagedepth>\n')
+        out.append(f'          <diveduration>{round(dive["divetime_min"] * 60)}</diveduration>\n')
+        if dive['vis_m']:
+            out.append(f'          <visibility>{dive["vis_m"]:.1f}</visibility>\n')
+        out.append('        </informationafterdive>\n')
+        out.append('      </dive>\n')
+        self.file.write(''.join(out))
+
+    def close(self):
+        self.file.write('    </repetitiongroup>\n  </profiledata>\n</uddf>\n')
+        self.file.close()
+
+
+def open_dive_writer(path, site_names=None, site_coords=None, export_format=None):
+    """Open a CSV or UDDF writer, choosing the format from the file extension if not given"""
+    export_format = (export_format or os.path.splitext(path)[1].lstrip('.')).lower()
+    if export_format == 'csv':
+        return CsvDiveWriter(path, site_names)
+    if export_format == 'uddf':
+        return UddfDiveWriter(path, site_names, site_coords)
+    raise ValueError(f"Unsupported export format '{export_format}', use one of: {', '.join(EXPORT_FORMATS)}")
+
+
+def export_dives(rows, path, assign=None, site_names=None, site_coords=None, export_format=None):
+    """Export an iterable of dive_details rows in a single pass.
+
+    assign(dive_data) returns (site_id, entry_type) for each dive; rows for
+    which it returns None are skipped. Returns the number of dives written.
+    """
+    writer = open_dive_writer(path, site_names, site_coords, export_format)
+    try:
+        for dive_data in rows:
+            assignment = assign(dive_data) if assign else ('0', 'Boat (22)')
+            if assignment is None:
+                continue
+            writer.write(dive_data, *assignment)
+    finally:
+        writer.close()
+    return writer.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a Shearwater logbook to CSV or UDDF")
+    parser.add_argument('database', help="Shearwater .db export")
+    parser.add_argument('output', help="Output file (.csv or .uddf)")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, help="Output format (default: from the file extension)")
+    parser.add_argument('--site', default='0', help="SSI site ID for all dives (default: 0)")
+    parser.add_argument('--entry', default='Boat (22)', help="Entry type for all dives (default: 'Boat (22)')")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        print(f"Database not found: {args.database}")
+        return 1
+    site_names, site_coords = {}, {}
+    if args.site != '0':
+        site = load_site_catalog().sites.get(args.site)
+        if site is None:
+            print(f"Warning: site ID {args.site} is not in the dive site catalog")
+        else:
+            site_names[args.site] = site['name']
+            site_coords[args.site] = (site['lat'], site['lng'])
+    count = export_dives(iter_dive_rows(args.database), args.output,
+                         assign=lambda dive_data: (args.site, args.entry),
+                         site_names=site_names, site_coords=site_coords,
+                         export_format=args.format)
+    print(f"Exported {count} dives to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
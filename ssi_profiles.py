@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Shearwater Dive Profile Thumbnails
+Renders small depth-profile sparklines from dive_log_records
+
+Usage:
+    python ssi_profiles.py shearwater_databases/logbook.db ssi_dives_qr_codes/profiles
+    python ssi_profiles.py shearwater_databases/logbook.db /tmp/profiles --dive-id 1234 --width 600
+
+The GUI shows the sparkline of a dive next to its QR code, so it can be checked
+against the dive before scanning. Thumbnails are cached in a `profiles` folder next
+to the QR codes, under the QR code's file name, and reused until the database changes.
+
+Each profile is reduced to one minimum/maximum depth pair per pixel column before
+drawing, so profiles with tens of thousands of samples render as fast as short ones
+and no peak is lost.
+
+DISCLAIMER: This software is for DEMONSTRATION AND EDUCATIONAL PURPOSES ONLY.
+Not affiliated with Shearwater Research Inc., SSI, or any diving organization.
+USE AT YOUR OWN RISK. See DISCLAIMER.md for full legal disclaimer.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, PngImagePlugin
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+PROFILE_DIR = 'profiles'
+PROFILE_WIDTH = 300
+PROFILE_HEIGHT = 60
+WATER_COLOR = (214, 234, 248)
+PROFILE_COLOR = (21, 101, 192)
+SOURCE_KEY = 'ssi-profile-source'  # PNG text chunk identifying the database and dive
+
+# Column names seen in Shearwater exports, matched case-insensitively
+LINK_COLUMNS = ('DiveId', 'DiveLogId', 'LogId')
+TIME_COLUMNS = ('CurrentTime', 'ElapsedTime', 'Time', 'TimeStamp')
+DEPTH_COLUMNS = ('CurrentDepth', 'Depth')
+SQL_PARAMS_PER_QUERY = 900
+
+
+def read_only_uri(db_path):
+    return Path(db_path).resolve().as_uri() + '?mode=ro'
+
+
+def _columns(conn, table):
+    return {row[1].lower(): row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _pick(columns, candidates):
+    for name in candidates:
+        if name.lower() in columns:
+            return columns[name.lower()]
+    return None
+
+
+def find_profile_query(conn):
+    """SQL selecting (DiveId, depth) of all samples of a list of dives, or None.
+
+    dive_log_records either carries the DiveId itself or a log ID that
+    dive_logs maps to the DiveId. The query has one '{ids}' placeholder
+    for the parameter list and orders samples by dive and time.
+    """
+    records = _columns(conn, 'dive_log_records')
+    depth = _pick(records, DEPTH_COLUMNS)
+    link = _pick(records, LINK_COLUMNS)
+    if not depth or not link:
+        return None
+    order = _pick(records, TIME_COLUMNS) or 'rowid'
+
+    if link.lower() == 'diveid':
+        return (f'SELECT r."{link}", r."{depth}" FROM dive_log_records r '
+                f'WHERE r."{link}" IN ({{ids}}) ORDER BY r."{link}", r."{order}"')
+
+    logs = _columns(conn, 'dive_logs')
+    log_dive = _pick(logs, ('DiveId',))
+    log_link = _pick(logs, (link,) + LINK_COLUMNS[1:])
+    if not log_dive or not log_link:
+        return None
+    return (f'SELECT l."{log_dive}", r."{depth}" FROM dive_log_records r '
+            f'JOIN dive_logs l ON r."{link}" = l."{log_link}" '
+            f'WHERE l."{log_dive}" IN ({{ids}}) ORDER BY l."{log_dive}", r."{order}"')
+
+
+def iter_profiles(conn, dive_ids, query=None):
+    """Yield (dive_id, depths) for the dives that have samples, reading each table once per chunk of IDs"""
+    query = query or find_profile_query(conn)
+    if query is None:
+        return
+    dive_ids = list(dict.fromkeys(dive_ids))
+    for start in range(0, len(dive_ids), SQL_PARAMS_PER_QUERY):
+        chunk = dive_ids[start:start + SQL_PARAMS_PER_QUERY]
+        current, depths = None, []
+        for dive_id, depth in conn.execute(query.format(ids=','.join('?' * len(chunk))), chunk):
+            if dive_id != current:
+                if depths:
+                    yield current, depths
+                current, depths = dive_id, []
+            if depth is not None:
+                depths.append(depth)
+        if depths:
+            yield current, depths
+
+
+def minmax_buckets(depths, width):
+    """Reduce samples to at most `width` (minimum, maximum) pairs, one per pixel column"""
+    n = len(depths)
+    columns = min(n, width)
+    if np is not None:
+        values = np.asarray(depths, dtype=float)
+        edges = (np.arange(columns) * n) // columns
+        return np.minimum.reduceat(values, edges).tolist(), np.maximum.reduceat(values, edges).tolist()
+
+    values = [float(d) for d in depths]
+    lows, highs = [], []
+    for i in range(columns):
+        bucket = values[i * n // columns:(i + 1) * n // columns]
+        lows.append(min(bucket))
+        highs.append(max(bucket))
+    return lows, highs
+
+
+def render_sparkline(depths, width=PROFILE_WIDTH, height=PROFILE_HEIGHT):
+    """Depth profile image: surface at the top, water down to the deepest point of each column"""
+    image = Image.new('RGB', (width, height), 'white')
+    if not len(depths):
+        return image
+    lows, highs = minmax_buckets(depths, width)
+    deepest = max(max(highs), 0.1)
+    scale = (height - 3) / deepest
+    draw = ImageDraw.Draw(image)
+    columns = len(lows)
+    for i, (low, high) in enumerate(zip(lows, highs)):
+        x0 = i * width // columns
+        x1 = max(x0, (i + 1) * width // columns - 1)
+        top = 1 + round(max(low, 0) * scale)
+        bottom = 1 + round(max(high, 0) * scale)
+        draw.rectangle((x0, 0, x1, bottom), fill=WATER_COLOR)
+        draw.rectangle((x0, top, x1, max(bottom, top + 1)), fill=PROFILE_COLOR)
+    return image
+
+
+def profile_source(db_path, dive_id):
+    st = os.stat(db_path)
+    return f"{os.path.abspath(db_path)}|{dive_id}|{st.st_mtime_ns}"
+
+
+def cached_profile(path, source):
+    """Read a cached thumbnail if it was rendered from the same database state"""
+    try:
+        with Image.open(path) as image:
+            if image.info.get(SOURCE_KEY) != source:
+                return None
+            image.load()
+            return image
+    except (OSError, ValueError):
+        return None
+
+
+def profile_thumbnails(db_path, dives, output_dir, width=PROFILE_WIDTH, height=PROFILE_HEIGHT):
+    """Thumbnails for (dive_id, qr filename) pairs, rendered or taken from output_dir/profiles.
+
+    Returns a dict of qr filename -> image; dives without profile samples are
+    left out. The tables may store DiveIds as integers in one place and as
+    strings in another, so each ID is looked up in both forms and results are
+    matched back by their text. Missing profile tables are not an error:
+    nothing is returned.
+    """
+    profile_dir = os.path.join(output_dir, PROFILE_DIR)
+    thumbnails = {}
+    missing = {}
+    lookup_ids = []
+    for dive_id, filename in dives:
+        source = profile_source(db_path, dive_id)
+        image = cached_profile(os.path.join(profile_dir, filename), source)
+        if image is not None:
+            thumbnails[filename] = image
+        else:
+            missing.setdefault(str(dive_id), []).append((filename, source))
+            # Columns without type affinity only match values of the same type
+            lookup_ids += [dive_id, str(dive_id)]
+            if str(dive_id).isdigit():
+                lookup_ids.append(int(dive_id))
+    if not missing:
+        return thumbnails
+
+    conn = sqlite3.connect(read_only_uri(db_path), uri=True)
+    try:
+        query = find_profile_query(conn)
+        if query is None:
+            return thumbnails
+        os.makedirs(profile_dir, exist_ok=True)
+        for dive_id, depths in iter_profiles(conn, lookup_ids, query):
+            image = render_sparkline(depths, width, height)
+            for filename, source in missing.get(str(dive_id), []):
+                info = PngImagePlugin.PngInfo()
+                info.add_text(SOURCE_KEY, source)
+                tmp_path = os.path.join(profile_dir, filename + '.tmp')
+                image.save(tmp_path, format='PNG', pnginfo=info)
+                os.replace(tmp_path, os.path.join(profile_dir, filename))
+                thumbnails[filename] = image
+    except sqlite3.Error as e:
+        print(f"Could not read dive profiles: {e}")
+    finally:
+        conn.close()
+    return thumbnails
+
+
+def prune_profiles(output_dir):
+    """Delete cached thumbnails whose QR code is no longer in output_dir"""
+    profile_dir = os.path.join(output_dir, PROFILE_DIR)
+    if not os.path.isdir(profile_dir):
+        return 0
+    removed = 0
+    for filename in os.listdir(profile_dir):
+        if not os.path.exists(os.path.join(output_dir, filename)):
+            try:
+                os.remove(os.path.join(profile_dir, filename))
+                removed += 1
+            except OSError as e:
+                print(f"Could not delete {filename}: {e}")
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render dive profile sparklines from a Shearwater database")
+    parser.add_argument('database', help="Shearwater .db export")
+    parser.add_argument('output', help="Directory for the PNG files (one per dive, named after the DiveId)")
+    parser.add_argument('--dive-id', action='append', help="Only this dive (can be repeated; default: all)")
+    parser.add_argument('--width', type=int, default=PROFILE_WIDTH, help=f"Width in pixels (default: {PROFILE_WIDTH})")
+    parser.add_argument('--height', type=int, default=PROFILE_HEIGHT,
+                        help=f"Height in pixels (default: {PROFILE_HEIGHT})")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        print(f"Database not found: {args.database}")
+        return 1
+    conn = sqlite3.connect(read_only_uri(args.database), uri=True)
+    try:
+        query = find_profile_query(conn)
+        if query is None:
+            print("No dive_log_records profile data found in this database")
+            return 1
+        dive_ids = args.dive_id or [row[0] for row in conn.execute("SELECT DiveId FROM dive_details")]
+        os.makedirs(args.output, exist_ok=True)
+
+        start = time.perf_counter()
+        count = samples = 0
+        render_seconds = 0.0
+        for dive_id, depths in iter_profiles(conn, dive_ids, query):
+            render_start = time.perf_counter()
+            image = render_sparkline(depths, args.width, args.height)
+            render_seconds += time.perf_counter() - render_start
+            image.save(os.path.join(args.output, f"dive_{dive_id}.png"))
+            count += 1
+            samples += len(depths)
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {count} profiles ({samples} samples) to {args.output} in {elapsed:.2f}s, "
+          f"{render_seconds / max(count, 1) * 1000:.2f} ms per profile to downsample and draw")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
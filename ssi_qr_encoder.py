@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+SSI Fast QR Encoder
+Builds QR symbols for SSI payloads with precomputed tables and NumPy mask scoring
+
+Usage:
+    python ssi_qr_encoder.py
+    python ssi_qr_encoder.py --count 20000 --png-every 10 --seed 7
+
+Run as a script, it checks the encoder against the qrcode library on payloads that
+build_ssi_payload makes from random dive rows (matrices, and PNG bytes for a share
+of them) and prints the speed of both. ssi_core.py uses it automatically when NumPy
+is installed.
+
+The output is meant to be identical to qrcode, not just equivalent: the same
+version fitting, data segmentation, Reed-Solomon codewords, mask choice (including
+qrcode's penalty rules) and image pixels. The slow parts are replaced:
+- the symbol layout (function patterns and data module order) is built once per
+  version, using qrcode's own pattern setup
+- Reed-Solomon remainders use a 256-entry table per generator polynomial, one
+  lookup per data byte
+- all eight masks are applied and scored at once on a NumPy array
+
+DISCLAIMER: This software is for DEMONSTRATION AND EDUCATIONAL PURPOSES ONLY.
+Not affiliated with Shearwater Research Inc., SSI, or any diving organization.
+USE AT YOUR OWN RISK. See DISCLAIMER.md for full legal disclaimer.
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+from bisect import bisect_left
+
+import qrcode
+from qrcode import base, util
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AVAILABLE = np is not None
+
+
+# GF(256) with the QR polynomial x^8 + x^4 + x^3 + x^2 + 1
+GF_EXP = [0] * 512
+GF_LOG = [0] * 256
+_value = 1
+for _i in range(255):
+    GF_EXP[_i] = _value
+    GF_LOG[_value] = _i
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+for _i in range(255, 512):
+    GF_EXP[_i] = GF_EXP[_i - 255]
+del _value, _i
+
+# Runs in the penalty rule 3 pattern, read as 11-bit numbers (first module = highest bit)
+FINDER_LIKE_PATTERNS = (0b10111010000, 0b00001011101)
+
+_rs_tables = {}
+_layouts = {}
+
+
+def _gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return GF_EXP[GF_LOG[a] + GF_LOG[b]]
+
+
+def rs_table(ec_count):
+    """Generator polynomial multiples for ec_count error correction codewords.
+
+    Entry f is the generator (without its leading 1) multiplied by f, packed
+    into one integer, so each data byte of the division costs one lookup and
+    one XOR instead of ec_count multiplications.
+    """
+    table = _rs_tables.get(ec_count)
+    if table is None:
+        generator = [1]
+        for i in range(ec_count):
+            generator = [a ^ _gf_mul(b, GF_EXP[i]) for a, b in zip(generator + [0], [0] + generator)]
+        coefficients = generator[1:]
+        table = [int.from_bytes(bytes(_gf_mul(c, f) for c in coefficients), 'big') for f in range(256)]
+        _rs_tables[ec_count] = table
+    return table
+
+
+def rs_remainder(data, ec_count):
+    """Reed-Solomon error correction codewords for a block of data codewords"""
+    table = rs_table(ec_count)
+    shift = 8 * (ec_count - 1)
+    low_bits = (1 << shift) - 1
+    remainder = 0
+    for byte in data:
+        remainder = ((remainder & low_bits) << 8) ^ table[(remainder >> shift) ^ byte]
+    return remainder.to_bytes(ec_count, 'big')
+
+
+def segment_data(data, optimize=20, mode=None):
+    """Split data into (mode, bytes) segments the same way qrcode.QRCode.add_data does"""
+    if mode is not None:
+        chunks = [util.QRData(data, mode=mode)]
+    elif optimize:
+        chunks = util.optimal_data_chunks(data, minimum=optimize)
+    else:
+        chunks = [util.QRData(data)]
+    return [(chunk.mode, chunk.data) for chunk in chunks]
+
+
+def _segment_bits(segments, version):
+    """Pack segments into (integer, bit count), mode and length headers included"""
+    mode_sizes = util.mode_sizes_for_version(version)
+    value = 0
+    length = 0
+    for mode, data in segments:
+        value = (value << 4) | mode
+        value = (value << mode_sizes[mode]) | len(data)
+        length += 4 + mode_sizes[mode]
+        if mode == util.MODE_8BIT_BYTE:
+            value = (value << (8 * len(data))) | int.from_bytes(data, 'big')
+            length += 8 * len(data)
+        elif mode == util.MODE_NUMBER:
+            for i in range(0, len(data), 3):
+                chars = data[i:i + 3]
+                bits = util.NUMBER_LENGTH[len(chars)]
+                value = (value << bits) | int(chars)
+                length += bits
+        else:
+            for i in range(0, len(data), 2):
+                chars = data[i:i + 2]
+                if len(chars) > 1:
+                    value = (value << 11) | (util.ALPHA_NUM.find(chars[0]) * 45 + util.ALPHA_NUM.find(chars[1]))
+                    length += 11
+                else:
+                    value = (value << 6) | util.ALPHA_NUM.find(chars)
+                    length += 6
+    return value, length
+
+
+def fit_version(segments, error_correction, start=1):
+    """Smallest version holding the segments, following qrcode's best_fit"""
+    while True:
+        needed_bits = _segment_bits(segments, start)[1]
+        version = bisect_left(util.BIT_LIMIT_TABLE[error_correction], needed_bits, start)
+        if version == 41:
+            raise qrcode.exceptions.DataOverflowError()
+        if util.mode_sizes_for_version(start) is util.mode_sizes_for_version(version):
+            return version
+        start = version
+
+
+def encode_codewords(segments, version, error_correction):
+    """Final codewords (uint8 array): data with terminator and padding, interleaved with error correction"""
+    value, length = _segment_bits(segments, version)
+    blocks = base.rs_blocks(version, error_correction)
+    bit_limit = 8 * sum(block.data_count for block in blocks)
+    if length > bit_limit:
+        raise qrcode.exceptions.DataOverflowError(
+            f"Code length overflow. Data size ({length}) > size available ({bit_limit})")
+
+    # Terminator of up to four zero bits, then zeros up to a byte boundary
+    pad = min(bit_limit - length, 4)
+    pad += -(length + pad) % 8
+    value <<= pad
+    length += pad
+    data = value.to_bytes(length // 8, 'big')
+    fill = (bit_limit - length) // 8
+    data += (b'\xec\x11' * (fill // 2 + 1))[:fill]
+
+    data_blocks, ec_blocks = [], []
+    offset = 0
+    for block in blocks:
+        chunk = data[offset:offset + block.data_count]
+        offset += block.data_count
+        data_blocks.append(chunk)
+        ec_blocks.append(rs_remainder(chunk, block.total_count - block.data_count))
+
+    codewords = np.frombuffer(b''.join(data_blocks + ec_blocks), dtype=np.uint8)
+    return codewords[_interleave_order(version, error_correction)]
+
+
+_interleave_orders = {}
+
+
+def _interleave_order(version, error_correction):
+    """Index array that interleaves the concatenated blocks codeword by codeword, as the standard requires"""
+    key = (version, error_correction)
+    order = _interleave_orders.get(key)
+    if order is None:
+        blocks = base.rs_blocks(version, error_correction)
+        data_starts, ec_starts = [], []
+        offset = 0
+        for block in blocks:
+            data_starts.append((offset, block.data_count))
+            offset += block.data_count
+        for block in blocks:
+            ec_starts.append((offset, block.total_count - block.data_count))
+            offset += block.total_count - block.data_count
+        order = []
+        for starts in (data_starts, ec_starts):
+            for i in range(max(count for _, count in starts)):
+                order.extend(start + i for start, count in starts if i < count)
+        order = _interleave_orders[key] = np.array(order, dtype=np.intp)
+    return order
+
+
+class _Layout:
+    """Function patterns, data module order and mask bits of one QR version"""
+
+    def __init__(self, version):
+        self.version = version
+        n = self.size = version * 4 + 17
+
+        # Let qrcode place the function patterns, with format and version
+        # areas reserved as light modules like in its mask evaluation
+        qr = qrcode.QRCode(version=version)
+        qr.modules_count = n
+        qr.modules = [[None] * n for _ in range(n)]
+        qr.setup_position_probe_pattern(0, 0)
+        qr.setup_position_probe_pattern(n - 7, 0)
+        qr.setup_position_probe_pattern(0, n - 7)
+        qr.setup_position_adjust_pattern()
+        qr.setup_timing_pattern()
+        qr.setup_type_info(True, 0)
+        if version >= 7:
+            qr.setup_type_number(True)
+
+        self.template = np.array([[bool(m) for m in row] for row in qr.modules], dtype=np.uint8)
+
+        # Data modules in placement order: two-column strips from the right, zig-zagging up and down
+        path = []
+        row, step = n - 1, -1
+        for col in range(n - 1, 0, -2):
+            if col <= 6:
+                col -= 1
+            while True:
+                for c in (col, col - 1):
+                    if qr.modules[row][c] is None:
+                        path.append(row * n + c)
+                row += step
+                if row < 0 or row >= n:
+                    row -= step
+                    step = -step
+                    break
+        self.path = np.array(path, dtype=np.intp)
+
+        rows, cols = np.divmod(self.path, n)
+        self.masks = np.array([
+            (rows + cols) % 2 == 0,
+            rows % 2 == 0,
+            cols % 3 == 0,
+            (rows + cols) % 3 == 0,
+            (rows // 2 + cols // 3) % 2 == 0,
+            (rows * cols) % 2 + (rows * cols) % 3 == 0,
+            ((rows * cols) % 2 + (rows * cols) % 3) % 2 == 0,
+            ((rows * cols) % 3 + (rows + cols) % 2) % 2 == 0,
+        ], dtype=np.uint8)
+
+
+def _layout(version):
+    layout = _layouts.get(version)
+    if layout is None:
+        layout = _layouts[version] = _Layout(version)
+    return layout
+
+
+def _run_penalties(symbols):
+    """Rule 1 points (run length - 2 for runs of 5 or more) per symbol, along rows.
+
+    A run of length L >= 5 holds L - 4 single-colour windows of five modules,
+    and exactly one of them starts the run, so its points are the windows plus
+    two per run start; no run lengths have to be extracted.
+    """
+    same = symbols[:, :, 1:] == symbols[:, :, :-1]
+    windows = same[:, :, :-3] & same[:, :, 1:-2] & same[:, :, 2:-1] & same[:, :, 3:]
+    run_starts = windows[:, :, 0].sum(axis=1) + (windows[:, :, 1:] & ~same[:, :, :-4]).sum(axis=(1, 2))
+    return windows.sum(axis=(1, 2)) + 2 * run_starts
+
+
+def _pattern_penalties(symbols):
+    """Rule 3 matches (finder-like 1:1:3:1:1 runs with four light modules) per symbol, along rows"""
+    n = symbols.shape[-1]
+    codes = symbols[:, :, :n - 10].astype(np.uint16)
+    for k in range(1, 11):
+        codes <<= 1
+        codes |= symbols[:, :, k:n - 10 + k]
+    matches = (codes == FINDER_LIKE_PATTERNS[0]) | (codes == FINDER_LIKE_PATTERNS[1])
+    return matches.sum(axis=(1, 2))
+
+
+def mask_penalties(symbols):
+    """qrcode's lost_point for a stack of symbols (k x n x n, 0/1), as a list of ints"""
+    k, n, _ = symbols.shape
+    # Rows of all symbols followed by their columns, so rules 1 and 3 run once over both
+    lines = np.concatenate([symbols, symbols.transpose(0, 2, 1)])
+
+    rule1 = _run_penalties(lines)
+    rule1 = rule1[:k] + rule1[k:]
+    top_left = symbols[:, :-1, :-1]
+    blocks = ((top_left == symbols[:, :-1, 1:]) & (top_left == symbols[:, 1:, :-1])
+              & (top_left == symbols[:, 1:, 1:]))
+    rule2 = blocks.sum(axis=(1, 2)) * 3
+    rule3 = _pattern_penalties(lines)
+    rule3 = (rule3[:k] + rule3[k:]) * 40
+    dark = symbols.sum(axis=(1, 2))
+
+    penalties = []
+    for i in range(k):
+        # Same float arithmetic as qrcode, so boundary cases round the same way
+        percent = float(int(dark[i])) / (n ** 2)
+        rule4 = int(abs(percent * 100 - 50) / 5) * 10
+        penalties.append(int(rule1[i]) + int(rule2[i]) + int(rule3[i]) + rule4)
+    return penalties
+
+
+def _set_format_info(matrix, error_correction, mask_pattern, version):
+    """Write the format (and for version 7+ the version) information, as qrcode's makeImpl does"""
+    n = matrix.shape[0]
+    bits = util.BCH_type_info((error_correction << 3) | mask_pattern)
+    for i in range(15):
+        mod = (bits >> i) & 1
+        if i < 6:
+            matrix[i, 8] = mod
+        elif i < 8:
+            matrix[i + 1, 8] = mod
+        else:
+            matrix[n - 15 + i, 8] = mod
+        if i < 8:
+            matrix[8, n - i - 1] = mod
+        elif i < 9:
+            matrix[8, 15 - i] = mod
+        else:
+            matrix[8, 15 - i - 1] = mod
+    matrix[n - 8, 8] = 1
+
+    if version >= 7:
+        bits = util.BCH_type_number(version)
+        for i in range(18):
+            mod = (bits >> i) & 1
+            matrix[i // 3, i % 3 + n - 11] = mod
+            matrix[i % 3 + n - 11, i // 3] = mod
+
+
+def qr_matrix(data, version=None, error_correction=qrcode.constants.ERROR_CORRECT_L, optimize=20, mode=None,
+              mask_pattern=None):
+    """QR modules (n x n uint8 array, 1 = dark) exactly as qrcode.QRCode would build them.
+
+    version=None fits the smallest version like make(fit=True); a fixed
+    version behaves like make(fit=False). mode forces a single segment, like
+    add_data(QRData(data, mode=mode)); otherwise data is split like add_data(data, optimize).
+    """
+    if not AVAILABLE:
+        raise RuntimeError("The fast QR encoder needs NumPy")
+    segments = segment_data(data, optimize, mode)
+    if version is None:
+        version = fit_version(segments, error_correction)
+    layout = _layout(version)
+    n = layout.size
+
+    bits = np.unpackbits(encode_codewords(segments, version, error_correction))
+    data_bits = np.zeros(len(layout.path), dtype=np.uint8)
+    data_bits[:len(bits)] = bits  # remainder modules stay light before masking
+
+    patterns = range(8) if mask_pattern is None else [mask_pattern]
+    symbols = np.repeat(layout.template.reshape(1, n * n), len(patterns), axis=0)
+    symbols[:, layout.path] = data_bits ^ layout.masks[list(patterns)]
+    symbols = symbols.reshape(-1, n, n)
+
+    if mask_pattern is None:
+        penalties = mask_penalties(symbols)
+        mask_pattern = penalties.index(min(penalties))
+        matrix = symbols[mask_pattern].copy()
+    else:
+        matrix = symbols[0]
+    _set_format_info(matrix, error_correction, mask_pattern, version)
+    return matrix
+
+
+def matrix_image(matrix, box_size=10, border=4):
+    """Black on white 1-bit image of a module matrix, pixel-identical to qrcode's PilImage"""
+    light = np.repeat(np.repeat(matrix == 0, box_size, axis=0), box_size, axis=1)
+    pad = border * box_size
+    light = np.pad(light, pad, constant_values=True)
+    return Image.fromarray(light)
+
+
+def qrcode_matrix(data, version=None, error_correction=qrcode.constants.ERROR_CORRECT_L, optimize=20, mode=None):
+    """Reference matrix from the qrcode library, for conformance checks"""
+    qr = qrcode.QRCode(version=version or 1, error_correction=error_correction)
+    if mode is not None:
+        qr.add_data(util.QRData(data, mode=mode))
+    else:
+        qr.add_data(data, optimize=optimize)
+    qr.make(fit=version is None)
+    return qr
+
+
+def random_payload(rng, compact=False):
+    """A real dive payload, built by build_ssi_payload from a random dive_details row"""
+    from ssi_core import build_ssi_payload  # ssi_core imports this module
+
+    date = rng.choice([
+        f"{rng.randint(1990, 2030)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+        f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+        None, 'not a date'
+    ])
+    row = (rng.randint(1, 10**6), date, rng.choice([rng.uniform(0, 130), 0, None]),
+           rng.choice([rng.randint(0, 18000), None]), 'Site', 'Location', rng.uniform(0, 60),
+           rng.choice([rng.uniform(-5, 40), 0, None]), None, rng.choice([rng.uniform(0, 40), 0, None]))
+    first = rng.choice(['Alice', 'Bob', 'Chloé', 'Dmitri', 'Ëve', 'Unknown', 'X' * rng.randint(1, 40)])
+    last = rng.choice(['Diver', 'Müller', "O'Neil", 'Unknown', 'ZZ' * rng.randint(1, 30)])
+    if rng.random() < 0.05:
+        # Long digit and upper-case runs exercise qrcode's numeric/alphanumeric segment splitting
+        first = f"{'7' * rng.randint(18, 60)}{'ABC 123:' * rng.randint(2, 6)}"
+    user_id = str(rng.choice([0, rng.randint(1, 10**8)]))
+    site_code = str(rng.choice([0, rng.randint(1, 999999)]))
+    entry_type = rng.choice(['Shore (21)', 'Boat (22)'])
+    return build_ssi_payload(row, first, last, user_id, site_code, entry_type, compact)
+
+
+def check_conformance(count, seed=0, png_every=10):
+    """Compare fast and qrcode output for random payloads, returning (mismatches, fast s, qrcode s).
+
+    Even payloads are standard ones on the default path, odd ones compact payloads
+    on the compact path. Some are truncated or repeated to reach small and large
+    versions.
+    """
+    rng = random.Random(seed)
+    mismatches = []
+    fast_seconds = ref_seconds = 0.0
+    for i in range(count):
+        payload = random_payload(rng, compact=bool(i % 2))
+        size = rng.random()
+        if size < 0.15:
+            payload = payload[:rng.randint(1, len(payload))]  # small versions, no version information
+        elif size < 0.2:
+            payload = (payload * rng.randint(2, 7))[:2000]  # large versions, longer length fields
+        if i % 2:
+            # The compact path: fixed version/error correction, one byte segment
+            segments = [(util.MODE_8BIT_BYTE, payload.encode('utf-8'))]
+            version = fit_version(segments, qrcode.constants.ERROR_CORRECT_L)
+            error_correction = rng.choice([0, 1, 2, 3])
+            if _segment_bits(segments, version)[1] > util.BIT_LIMIT_TABLE[error_correction][version]:
+                error_correction = qrcode.constants.ERROR_CORRECT_L
+            kwargs = {'version': version, 'error_correction': error_correction,
+                      'mode': util.MODE_8BIT_BYTE, 'data': payload.encode('utf-8')}
+        else:
+            kwargs = {'data': payload, 'error_correction': qrcode.constants.ERROR_CORRECT_L}
+
+        start = time.perf_counter()
+        matrix = qr_matrix(**kwargs)
+        fast_image = matrix_image(matrix) if i % png_every == 0 else None
+        fast_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        qr = qrcode_matrix(**kwargs)
+        ref_image = qr.make_image(fill_color="black", back_color="white") if i % png_every == 0 else None
+        ref_seconds += time.perf_counter() - start
+
+        if matrix.tolist() != [[int(m) for m in row] for row in qr.modules]:
+            mismatches.append((i, 'matrix', payload))
+            continue
+        if fast_image is not None:
+            fast_png, ref_png = io.BytesIO(), io.BytesIO()
+            fast_image.save(fast_png, format='PNG')
+            ref_image.save(ref_png, format='PNG')
+            if fast_png.getvalue() != ref_png.getvalue():
+                mismatches.append((i, 'png', payload))
+    return mismatches, fast_seconds, ref_seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the fast QR encoder against the qrcode library")
+    parser.add_argument('--count', type=int, default=2000, help="Random payloads to check (default: 2000)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument('--png-every', type=int, default=10,
+                        help="Also compare rendered PNG bytes for every Nth payload (default: 10)")
+    args = parser.parse_args(argv)
+
+    if not AVAILABLE:
+        print("NumPy is not installed, the fast QR encoder is not available")
+        return 1
+
+    mismatches, fast_seconds, ref_seconds = check_conformance(args.count, args.seed, max(1, args.png_every))
+    for i, kind, payload in mismatches[:20]:
+        print(f"Mismatch ({kind}) for payload #{i}: {payload}")
+    print(f"{args.count - len(mismatches)}/{args.count} symbols identical to qrcode")
+    print(f"fast: {fast_seconds / args.count * 1000:.2f} ms/symbol, qrcode: {ref_seconds / args.count * 1000:.2f} ms/symbol "
+          f"({ref_seconds / max(fast_seconds, 1e-9):.1f}x)")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Shearwater to SSI Regression Harness
+Checks payloads and QR codes of a synthetic logbook against stored golden outputs, and measures throughput
+
+Usage:
+    python ssi_regression.py                  # check every QR engine against regression/golden.jsonl.gz
+    python ssi_regression.py --engine fast    # check one engine
+    python ssi_regression.py --update         # rewrite the golden outputs after an intended format change
+
+A seeded synthetic dive_details database is written to a temporary file and read back
+with the same query as the GUI. It has the awkward rows real logbooks contain: NULL and
+malformed DiveDate values, zero and missing depths and durations, numbers stored as
+text, and negative temperatures. Each dive is built into a standard and a compact
+payload with rotating buddies (including non-ASCII names), sites and Shore/Boat entry
+types. Every payload is compared with its golden string. Every rendered QR image is
+decoded back to its module matrix and compared with the golden version and matrix
+digest. Golden outputs are written with the qrcode engine, the reference, so a faster
+engine passes only if it produces the same symbols.
+
+Throughput of each stage is printed and appended to regression/throughput.jsonl.
+
+DISCLAIMER: This software is for DEMONSTRATION AND EDUCATIONAL PURPOSES ONLY.
+Not affiliated with Shearwater Research Inc., SSI, or any diving organization.
+USE AT YOUR OWN RISK. See DISCLAIMER.md for full legal disclaimer.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from PIL import Image
+
+import ssi_qr_encoder
+from ssi_core import DEFAULT_QR_ENGINE, QR_ENGINES, build_ssi_payload, iter_dive_rows, make_qr_image
+
+
+REGRESSION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regression')
+GOLDEN_PATH = os.path.join(REGRESSION_DIR, 'golden.jsonl.gz')
+THROUGHPUT_LOG = os.path.join(REGRESSION_DIR, 'throughput.jsonl')
+GOLDEN_FORMAT = "ssi-golden-1"
+REFERENCE_ENGINE = 'qrcode'
+DEFAULT_COUNT = 500
+DEFAULT_SEED = 0
+BOX_SIZE = 10  # make_qr_image renders 10 pixels per module with a 4 module border
+BORDER = 4
+
+MALFORMED_DATES = [
+    None, '', '2025-02-30 10:00:00', '2025-03-05T10:38:45', '05/03/2025 10:38',
+    '2025-03-05 10:38', ' 2025-03-05 10:38:45', 'not a date'
+]
+BUDDIES = [
+    ('Unknown', 'Unknown', '0'),
+    ('Anna', 'Muster', '123456'),
+    ('Zoë', 'Ørsted-Łukasiewicz', '98765'),
+    ('Jean-Luc', "O'Neil", '4000000001'),
+    ('李', '小龙', '1'),
+    ('Maximiliane Josephine', 'von Hohenzollern-Sigmaringen', '31415926'),
+]
+SITE_CODES = ['0', '68089', '1', '1234567']
+ENTRY_TYPES = ['Shore (21)', 'Boat (22)']
+
+
+def synthetic_dive_rows(count=DEFAULT_COUNT, seed=DEFAULT_SEED):
+    """Deterministic dive_details rows, four in ten with an edge case"""
+    rng = random.Random(seed)
+    start = datetime(2015, 1, 1, 6, 0, 0)
+    rows = []
+    for i in range(count):
+        date = (start + timedelta(minutes=rng.randrange(0, 10 * 365 * 24 * 60))).strftime("%Y-%m-%d %H:%M:%S")
+        depth = round(rng.uniform(3, 60), rng.choice([0, 1, 2]))
+        duration = rng.randrange(600, 5400)
+        temp = round(rng.uniform(4, 30), 1)
+        visibility = rng.choice([5, 10, 12.5, 20, 30])
+
+        kind = i % 10
+        if kind == 1:
+            date = MALFORMED_DATES[(i // 10) % len(MALFORMED_DATES)]
+        elif kind == 3:
+            depth = rng.choice([0, 0.0, None, '0', 0.04])
+        elif kind == 5:
+            duration, temp, visibility = rng.choice([(0, 0, 0), (None, None, None), (2700.0, -1.5, '15')])
+        elif kind == 7:
+            depth = rng.choice([f"{depth}", 2.25, 2.35, 0.05, 130.0])
+            duration = rng.choice([f"{duration}", 36000, 59])
+
+        rows.append((f"{seed}-{i}", date, depth, duration, f"Site {i % 37}", "Location Ä", round(rng.uniform(2, 30), 1),
+                     temp, rng.choice([None, 'Sunny']), visibility))
+    return rows
+
+
+def dive_settings(dive_id):
+    """Buddy, site code and entry type of a synthetic dive, derived from its DiveId"""
+    n = int(str(dive_id).rsplit('-', 1)[1])
+    return BUDDIES[n % len(BUDDIES)], SITE_CODES[n % len(SITE_CODES)], ENTRY_TYPES[(n // 2) % len(ENTRY_TYPES)]
+
+
+def write_corpus_db(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("CREATE TABLE dive_details (DiveId, DiveDate, Depth, DiveLengthTime, Site, Location, "
+                     "AverageDepth, AverageTemp, Weather, Visibility)")
+        conn.executemany("INSERT INTO dive_details VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def build_cases(rows):
+    """(key, payload, compact) for the standard and compact payload of every dive"""
+    cases = []
+    for row in rows:
+        (firstname, lastname, user_id), site_code, entry_type = dive_settings(row[0])
+        for compact in (False, True):
+            payload = build_ssi_payload(row, firstname, lastname, user_id, site_code, entry_type, compact)
+            cases.append((f"{row[0]}/{'compact' if compact else 'standard'}", payload, compact))
+    return cases
+
+
+def decode_qr_image(img):
+    """Read the module matrix back from a rendered QR image.
+
+    Returns (version, digest of the matrix), or raises ValueError if the
+    image is not a clean grid of BOX_SIZE pixel modules inside a white border.
+    """
+    img = img.get_image() if hasattr(img, 'get_image') else img
+    img = img.convert('1')
+    side = img.size[0]
+    modules = side // BOX_SIZE - 2 * BORDER
+    if img.size != (side, side) or side % BOX_SIZE or (modules - 17) % 4 or modules < 21:
+        raise ValueError(f"unexpected QR image size {img.size}")
+    edge = BORDER * BOX_SIZE
+    grid = img.crop((edge, edge, side - edge, side - edge))
+    matrix = grid.resize((modules, modules), Image.Resampling.NEAREST)  # samples each module's center
+    if matrix.resize(grid.size, Image.Resampling.NEAREST).tobytes() != grid.tobytes():
+        raise ValueError("modules are not uniform blocks")
+    framed = Image.new('1', img.size, 1)
+    framed.paste(grid, (edge, edge))
+    if framed.tobytes() != img.tobytes():
+        raise ValueError("border is not white")
+    digest = hashlib.sha256(f"{modules}:".encode('ascii') + matrix.tobytes()).hexdigest()[:32]
+    return (modules - 17) // 4, digest
+
+
+def render_cases(cases, engine):
+    """Render every case with an engine; returns ({key: (version, digest)}, seconds spent rendering)"""
+    results = {}
+    seconds = 0.0
+    for key, payload, compact in cases:
+        start = time.perf_counter()
+        img = make_qr_image(payload, compact, engine)
+        seconds += time.perf_counter() - start
+        results[key] = decode_qr_image(img)
+    return results, seconds
+
+
+def load_golden(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('format') != GOLDEN_FORMAT:
+            raise ValueError(f"{path} is not a {GOLDEN_FORMAT} file")
+        return header, {case['key']: case for case in map(json.loads, f)}
+
+
+def write_golden(path, header, cases, symbols):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    # No name or mtime in the gzip header keeps the file byte-identical when nothing changed
+    with open(tmp_path, 'wb') as raw, gzip.GzipFile(filename='', fileobj=raw, mode='wb', mtime=0) as gz:
+        lines = [header] + [
+            {'key': key, 'payload': payload, 'version': symbols[key][0], 'matrix': symbols[key][1]}
+            for key, payload, _ in cases
+        ]
+        gz.write(''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in lines).encode('utf-8'))
+    os.replace(tmp_path, path)
+
+
+def compare(cases, golden, symbols=None, label='payload', max_report=10):
+    """Count mismatches against the golden outputs, printing the first few"""
+    failures = 0
+    for key, payload, _ in cases:
+        expected = golden.get(key)
+        if expected is None:
+            problem = "missing from golden outputs"
+        elif symbols is None:
+            problem = None if payload == expected['payload'] else \
+                f"payload changed\n    golden: {expected['payload']}\n    now:    {payload}"
+        else:
+            version, digest = symbols[key]
+            problem = None if (version, digest) == (expected['version'], expected['matrix']) else \
+                f"QR changed: v{expected['version']} {expected['matrix']} -> v{version} {digest}"
+        if problem:
+            failures += 1
+            if failures <= max_report:
+                print(f"  [{label}] {key}: {problem}")
+    if failures > max_report:
+        print(f"  [{label}] ... and {failures - max_report} more")
+    return failures
+
+
+def record_throughput(path, record):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check payloads and QR codes against golden outputs")
+    parser.add_argument('--engine', choices=QR_ENGINES + ('all',), default='all',
+                        help="QR engine to check (default: all)")
+    parser.add_argument('--golden', default=GOLDEN_PATH, help="Golden outputs file (default: regression/golden.jsonl.gz)")
+    parser.add_argument('--update', action='store_true',
+                        help=f"Rewrite the golden outputs, rendered with the {REFERENCE_ENGINE} engine")
+    parser.add_argument('--count', type=int, help=f"Synthetic dives with --update (default: {DEFAULT_COUNT})")
+    parser.add_argument('--seed', type=int, help=f"Corpus seed with --update (default: {DEFAULT_SEED})")
+    parser.add_argument('--log', default=THROUGHPUT_LOG,
+                        help="File the throughput is appended to (default: regression/throughput.jsonl, '' to skip)")
+    args = parser.parse_args(argv)
+
+    golden = None
+    if args.update:
+        count = args.count or DEFAULT_COUNT
+        seed = DEFAULT_SEED if args.seed is None else args.seed
+    else:
+        if args.count is not None or args.seed is not None:
+            parser.error("--count and --seed only apply with --update; checks use the golden file's corpus")
+        if not os.path.exists(args.golden):
+            print(f"No golden outputs at {args.golden}; create them with --update")
+            return 1
+        header, golden = load_golden(args.golden)
+        count, seed = header['count'], header['seed']
+
+    engines = list(QR_ENGINES) if args.engine == 'all' else [args.engine]
+    if args.update and REFERENCE_ENGINE not in engines:
+        engines.insert(0, REFERENCE_ENGINE)
+    if 'fast' in engines and not ssi_qr_encoder.AVAILABLE:
+        print("Skipping the fast engine: NumPy is not installed")
+        engines.remove('fast')
+    if not engines:
+        return 1
+
+    rows = synthetic_dive_rows(count, seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'corpus.db')
+        write_corpus_db(db_path, rows)
+        start = time.perf_counter()
+        db_rows = list(iter_dive_rows(db_path))
+        read_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cases = build_cases(db_rows)
+    payload_seconds = time.perf_counter() - start
+    print(f"Corpus: {len(db_rows)} dives (seed {seed}), {len(cases)} payloads")
+
+    throughput = {
+        'rows_per_s': round(len(db_rows) / max(read_seconds, 1e-9)),
+        'payloads_per_s': round(len(cases) / max(payload_seconds, 1e-9)),
+    }
+    print(f"  read dives:     {throughput['rows_per_s']:>9,} rows/s")
+    print(f"  build payloads: {throughput['payloads_per_s']:>9,} payloads/s")
+
+    failures = 0 if golden is None else compare(cases, golden)
+    rendered = {}
+    for engine in engines:
+        symbols, seconds = render_cases(cases, engine)
+        rendered[engine] = symbols
+        rate = len(cases) / max(seconds, 1e-9)
+        throughput[f"qr_per_s_{engine}"] = round(rate, 1)
+        default = " (default)" if engine == DEFAULT_QR_ENGINE else ""
+        print(f"  render QR, {engine + default + ':':<16} {rate:>9,.1f} symbols/s ({seconds / len(cases) * 1000:.2f} ms each)")
+        if golden is not None:
+            failures += compare(cases, golden, symbols, label=engine)
+
+    if args.update:
+        reference = rendered[REFERENCE_ENGINE]
+        for engine, symbols in rendered.items():
+            if engine != REFERENCE_ENGINE and symbols != reference:
+                differing = sum(symbols[key] != reference[key] for key in reference)
+                print(f"Not updating: the {engine} engine differs from {REFERENCE_ENGINE} on {differing} symbols")
+                return 1
+        write_golden(args.golden, {'format': GOLDEN_FORMAT, 'count': count, 'seed': seed}, cases, reference)
+        print(f"Wrote {len(cases)} golden outputs to {args.golden}")
+
+    if args.log:
+        record_throughput(args.log, {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'dives': len(db_rows),
+            'payloads': len(cases),
+            **throughput,
+        })
+
+    if golden is not None:
+        if failures:
+            print(f"FAILED: {failures} outputs differ from {args.golden}")
+            return 1
+        print(f"OK: {len(cases)} payloads and {len(cases) * len(engines)} QR codes match the golden outputs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
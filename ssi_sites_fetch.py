@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+SSI Dive Site Catalog Fetcher
+Fetches all dive sites in a bounding box from locationServices.php into a region catalog
+
+Usage:
+    python ssi_sites_fetch.py ssi_dive_sites/bonaire.json --bounds 11.9 -68.5 12.5 -67.9
+    python ssi_sites_fetch.py ssi_dive_sites/red_sea.json --bounds 22 32 30 38 --tile-size 1 --concurrency 4 --rate 2
+
+The box is split into tiles, one BOUNDS_CHANGED request per tile, the same request
+the SSI site locator sends when the map moves. Requests run concurrently over a small
+pool of kept-alive connections, with a shared rate limit and retries with backoff.
+Results are merged into the catalog like ssi_sites_ingest.py does: existing sites are
+kept and only new site IDs are added.
+
+Use ssi_sites_mock_server.py and --url to try it out offline.
+
+DISCLAIMER: This software is for DEMONSTRATION AND EDUCATIONAL PURPOSES ONLY.
+Not affiliated with Shearwater Research Inc., SSI, or any diving organization.
+USE AT YOUR OWN RISK. See DISCLAIMER.md for full legal disclaimer.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import ssl
+import sys
+import time
+from urllib.parse import urlsplit
+
+from ssi_core import iter_response_sites
+from ssi_sites_ingest import is_compact, load_catalog, write_catalog
+
+
+API_URL = "https://www.divessi.com/api/locationServices.php"
+FORM_BOUNDARY = "----shearwater2ssiFormBoundary"
+USER_AGENT = "shearwater2ssi-fetch/1.0"
+
+DEFAULT_TILE_DEG = 0.5
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 2.0  # requests per second, across all connections
+DEFAULT_RETRIES = 3
+DEFAULT_TIMEOUT = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def tile_bounds(south, west, north, east, tile_deg):
+    """Split a bounding box into tiles of at most tile_deg degrees per side.
+
+    Tile edges are computed from the same expression on both sides, so
+    neighbouring tiles share exactly the same boundary values.
+    """
+    if south >= north or west >= east:
+        raise ValueError("bounds must be south < north and west < east")
+    rows = max(1, -int(-(north - south) // tile_deg))
+    cols = max(1, -int(-(east - west) // tile_deg))
+    lats = [south + (north - south) * i / rows for i in range(rows)] + [north]
+    lngs = [west + (east - west) * j / cols for j in range(cols)] + [east]
+    return [
+        {'south': lats[i], 'west': lngs[j], 'north': lats[i + 1], 'east': lngs[j + 1]}
+        for i in range(rows) for j in range(cols)
+    ]
+
+
+def build_request_body(bounds):
+    """Multipart form body with the BOUNDS_CHANGED request, as sent by the site locator"""
+    request = {
+        'type': 'BOUNDS_CHANGED',
+        'filter': {
+            'targets': ['DiveSites'],
+            'geoBounds': bounds,
+            'viewportCenter': {'lat': (bounds['south'] + bounds['north']) / 2,
+                               'lng': (bounds['west'] + bounds['east']) / 2}
+        }
+    }
+    return (
+        f"--{FORM_BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="request"\r\n'
+        "\r\n"
+        f"{json.dumps(request, separators=(',', ':'))}\r\n"
+        f"--{FORM_BOUNDARY}--\r\n"
+    ).encode('utf-8')
+
+
+class RateLimiter:
+    """Space request starts at least 1/rate seconds apart, shared by all workers"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_start - now
+            self.next_start = max(now, self.next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class HttpConnection:
+    """Minimal HTTP/1.1 client over one kept-alive connection.
+
+    Reconnects transparently when the server closed the connection between
+    requests. Supports Content-Length and chunked responses.
+    """
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported URL scheme: {url}")
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        self.host_header = parts.netloc
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.connects = 0
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout)
+        self.connects += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def post(self, body, content_type):
+        """Send a POST and return (status, body bytes, lowercased headers)"""
+        fresh = self.writer is None
+        if fresh:
+            await self._connect()
+        try:
+            return await asyncio.wait_for(self._exchange(body, content_type), self.timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            if fresh:
+                raise
+            # The kept-alive connection went stale: retry once on a new one
+            await self._connect()
+            return await asyncio.wait_for(self._exchange(body, content_type), self.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _exchange(self, body, content_type):
+        self.writer.write(
+            f"POST {self.path} HTTP/1.1\r\n"
+            f"Host: {self.host_header}\r\n"
+            f"User-Agent: {USER_AGENT}\r\n"
+            "Accept: application/json\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n"
+            "\r\n".encode('latin-1') + body
+        )
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by server")
+        status = int(status_line.split(b' ', 2)[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            parts = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                parts.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            data = b''.join(parts)
+        elif 'content-length' in headers:
+            data = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            data = await self.reader.read()
+            headers['connection'] = 'close'
+
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, data, headers
+
+
+async def fetch_sites(tiles, url=API_URL, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                      retries=DEFAULT_RETRIES, timeout=DEFAULT_TIMEOUT, progress=None):
+    """Fetch every tile and merge the sites, returning (sites by ID, stats).
+
+    Each of the `concurrency` workers owns one connection of the pool and takes
+    tiles from a shared queue, so a slow tile never holds up the others.
+    """
+    queue = asyncio.Queue()
+    for tile in tiles:
+        queue.put_nowait(tile)
+    limiter = RateLimiter(rate)
+    content_type = f"multipart/form-data; boundary={FORM_BOUNDARY}"
+    sites = {}
+    stats = {'tiles': len(tiles), 'failed': [], 'requests': 0, 'retries': 0, 'connections': 0,
+             'bytes': 0, 'sites_seen': 0, 'done': 0}
+
+    async def worker():
+        conn = HttpConnection(url, timeout)
+        try:
+            while True:
+                try:
+                    tile = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                body = build_request_body(tile)
+                for attempt in range(retries + 1):
+                    if attempt:
+                        stats['retries'] += 1
+                    await limiter.wait()
+                    stats['requests'] += 1
+                    try:
+                        status, data, headers = await conn.post(body, content_type)
+                    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                        error, retry_after = f"{type(e).__name__}: {e}", None
+                    else:
+                        if status == 200:
+                            stats['bytes'] += len(data)
+                            for site in iter_response_sites(io.BytesIO(data)):
+                                stats['sites_seen'] += 1
+                                sites.setdefault(site['id'], site)
+                            break
+                        error = f"HTTP {status}"
+                        retry_after = headers.get('retry-after')
+                        if status not in RETRY_STATUSES:
+                            stats['failed'].append((tile, error))  # not worth retrying
+                            break
+                    if attempt == retries:
+                        stats['failed'].append((tile, error))
+                        break
+                    delay = 0.5 * 2 ** attempt
+                    if retry_after and retry_after.isdigit():
+                        delay = max(delay, float(retry_after))
+                    await asyncio.sleep(delay)
+                stats['done'] += 1
+                if progress:
+                    progress(stats['done'], len(tiles), len(sites))
+        finally:
+            stats['connections'] += conn.connects
+            conn.close()
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(tiles))))))
+    return sites, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch SSI dive sites in a bounding box into a region catalog")
+    parser.add_argument('catalog', help="Region catalog to create or update (e.g. ssi_dive_sites/bonaire.json)")
+    parser.add_argument('--bounds', nargs=4, type=float, required=True, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'),
+                        help="Bounding box in degrees")
+    parser.add_argument('--tile-size', type=float, default=DEFAULT_TILE_DEG,
+                        help=f"Maximum tile size in degrees (default: {DEFAULT_TILE_DEG})")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Pooled connections / parallel requests (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f"Maximum requests per second, 0 for no limit (default: {DEFAULT_RATE})")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f"Retries per tile after errors or 429/5xx responses (default: {DEFAULT_RETRIES})")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f"Seconds per request (default: {DEFAULT_TIMEOUT:g})")
+    parser.add_argument('--url', default=API_URL, help="API endpoint (default: the SSI site locator API)")
+    parser.add_argument('--region', help="Region name stored in the catalog (default: from the file name)")
+    args = parser.parse_args(argv)
+
+    try:
+        tiles = tile_bounds(*args.bounds, args.tile_size)
+    except ValueError as e:
+        print(f"Invalid bounds: {e}")
+        return 1
+
+    def progress(done, total, found):
+        print(f"\r{done}/{total} tiles, {found} sites", end='', flush=True)
+
+    start = time.perf_counter()
+    fetched, stats = asyncio.run(fetch_sites(tiles, args.url, args.concurrency, args.rate,
+                                             args.retries, args.timeout, progress))
+    elapsed = time.perf_counter() - start
+    print()
+    print(f"{stats['requests']} requests ({stats['retries']} retries) on {stats['connections']} connections, "
+          f"{stats['bytes'] / 1e6:.1f} MB in {elapsed:.2f}s: "
+          f"{len(tiles) / max(elapsed, 1e-6):.1f} tiles/s, {stats['sites_seen'] / max(elapsed, 1e-6):.0f} sites/s")
+    for tile, error in stats['failed']:
+        print(f"Failed tile {tile['south']:.4f},{tile['west']:.4f} - {tile['north']:.4f},{tile['east']:.4f}: {error}")
+
+    original_size = os.path.getsize(args.catalog) if os.path.exists(args.catalog) else 0
+    sites = load_catalog(args.catalog)
+    existing = len(sites)
+    for site_id, site in fetched.items():
+        sites.setdefault(site_id, site)
+    added = len(sites) - existing
+
+    if not sites:
+        print("No dive sites found, catalog not written")
+        return 1
+    if added or not is_compact(args.catalog):
+        write_catalog(args.catalog, sites, args.region)
+        print(f"{args.catalog}: {existing} existing + {added} new = {len(sites)} sites, "
+              f"{original_size} -> {os.path.getsize(args.catalog)} bytes")
+    else:
+        print(f"{args.catalog}: no new sites, {len(sites)} sites unchanged")
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+SSI Dive Site Catalog Ingestion
+Merges captured locationServices.php responses into one compact, deduplicated region catalog
+
+Usage:
+    python ssi_sites_ingest.py ssi_dive_sites/bonaire.json captures/bonaire_*.json
+
+The catalog is updated incrementally: sites already in it are kept as they are and only
+sites with new IDs are added. Image collections, statistics and other API metadata are dropped.
+
+DISCLAIMER: This software is for DEMONSTRATION AND EDUCATIONAL PURPOSES ONLY.
+Not affiliated with Shearwater Research Inc., SSI, or any diving organization.
+USE AT YOUR OWN RISK. See DISCLAIMER.md for full legal disclaimer.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from ssi_core import COMPACT_SITES_FORMAT, iter_region_sites
+
+
+def site_sort_key(site):
+    site_id = site['id']
+    return (0, int(site_id), '') if site_id.isdigit() else (1, 0, site_id)
+
+
+def load_catalog(path):
+    """Load an existing catalog (compact or raw API capture) as a dict of site ID -> site"""
+    sites = {}
+    if os.path.exists(path):
+        for site in iter_region_sites(path):
+            sites.setdefault(site['id'], site)
+    return sites
+
+
+def merge_captures(sites, capture_paths):
+    """Add sites with new IDs from each capture, returning the number of sites added"""
+    added = 0
+    for capture_path in capture_paths:
+        try:
+            start = time.perf_counter()
+            seen = 0
+            new_in_capture = 0
+            # Captures are streamed, so even continent-sized responses use little memory
+            for site in iter_region_sites(capture_path):
+                seen += 1
+                if site['id'] not in sites:
+                    sites[site['id']] = site
+                    new_in_capture += 1
+            elapsed = time.perf_counter() - start
+            print(f"{capture_path}: {seen} site(s), {new_in_capture} new "
+                  f"({seen / max(elapsed, 1e-6):.0f} sites/s)")
+            added += new_in_capture
+        except Exception as e:
+            print(f"Could not read {capture_path}: {e}")
+    return added
+
+
+def write_catalog(path, sites, region=None):
+    """Write the catalog atomically, one site per line to keep diffs readable"""
+    if region is None:
+        region = os.path.splitext(os.path.basename(path))[0].replace('_', ' ').title()
+    lines = [
+        json.dumps({k: site[k] for k in ('id', 'name', 'lat', 'lng')}, ensure_ascii=False)
+        for site in sorted(sites.values(), key=site_sort_key)
+    ]
+    content = (
+        '{\n'
+        f'  "format": {json.dumps(COMPACT_SITES_FORMAT)},\n'
+        f'  "region": {json.dumps(region, ensure_ascii=False)},\n'
+        '  "sites": [\n    ' + ',\n    '.join(lines) + '\n  ]\n'
+        '}\n'
+    )
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def is_compact(path):
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('format') == COMPACT_SITES_FORMAT
+    except Exception:
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge captured SSI dive site responses into a compact region catalog")
+    parser.add_argument('catalog', help="Region catalog to create or update (e.g. ssi_dive_sites/bonaire.json)")
+    parser.add_argument('captures', nargs='*', help="Captured locationServices.php JSON responses")
+    parser.add_argument('--region', help="Region name stored in the catalog (default: from the file name)")
+    args = parser.parse_args(argv)
+
+    original_size = os.path.getsize(args.catalog) if os.path.exists(args.catalog) else 0
+    sites = load_catalog(args.catalog)
+    existing = len(sites)
+    added = merge_captures(sites, args.captures)
+
+    if not sites:
+        print("No dive sites found, catalog not written")
+        return 1
+
+    # Rewrite an unchanged catalog only to convert it from a raw capture to the compact format
+    if added or not is_compact(args.catalog):
+        write_catalog(args.catalog, sites, args.region)
+        print(f"{args.catalog}: {existing} existing + {added} new = {len(sites)} sites, "
+              f"{original_size} -> {os.path.getsize(args.catalog)} bytes")
+    else:
+        print(f"{args.catalog}: no new sites, {len(sites)} sites unchanged")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+SSI Dive Site Mock Server
+Local stand-in for locationServices.php, for testing and benchmarking ssi_sites_fetch.py offline
+
+Usage:
+    python ssi_sites_mock_server.py --port 8765 --latency 0.05 --error-rate 0.1
+    python ssi_sites_fetch.py ssi_dive_sites/test.json --bounds 11.9 -68.5 12.5 -67.9 --url http://127.0.0.1:8765/api/locationServices.php
+
+Sites are generated on a fixed grid, so every request for the same bounds gets the
+same sites and neighbouring tiles agree on the sites they share. Responses have the
+same shape as the real API, including the image collections and statistics the
+parser has to skip. Connections are kept alive like on the real server.
+
+DISCLAIMER: This software is for DEMONSTRATION AND EDUCATIONAL PURPOSES ONLY.
+Not affiliated with Shearwater Research Inc., SSI, or any diving organization.
+USE AT YOUR OWN RISK. See DISCLAIMER.md for full legal disclaimer.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sys
+from urllib.parse import unquote_plus
+
+
+GRID_STEP = 0.02  # degrees between generated sites
+MAX_HEADER_BYTES = 64 * 1024
+
+REQUEST_FIELD_PATTERN = re.compile(rb'name="request"\r?\n\r?\n(.*?)\r?\n--', re.S)
+
+
+def grid_sites(bounds, step=GRID_STEP):
+    """Generate the sites on the grid inside bounds, with IDs derived from the grid cell"""
+    south, west, north, east = (bounds[k] for k in ('south', 'west', 'north', 'east'))
+    sites = []
+    for row in range(math.ceil(south / step), math.floor(north / step) + 1):
+        for col in range(math.ceil(west / step), math.floor(east / step) + 1):
+            lat, lng = row * step, col * step
+            if not (south <= lat < north and west <= lng < east):
+                continue  # half-open bounds, so a site belongs to exactly one tile
+            site_id = str(100000 + (row + 4500) * 18001 + (col + 9000))
+            sites.append({
+                'id': site_id,
+                'name': f"Mock Site {site_id}",
+                'lat': f"{lat:.4f}",
+                'lng': f"{lng:.4f}",
+                'loggedDives': str(int(site_id) % 500),
+                'averageRating': "4",
+                'loggedUsers': str(int(site_id) % 50),
+                'averageMaxDepth': "18",
+                'averageDivetime': "45",
+                'averageVis': "15",
+                'distanceToCenter': "0.00",
+                'images': {
+                    'type': "mediaCollection",
+                    'ident': "images",
+                    'elements': [
+                        {
+                            'type': "image",
+                            'thumbnail': f"https://cdn.example.invalid/sites/{site_id}/{n}/200.jpg",
+                            'detail': f"https://cdn.example.invalid/sites/{site_id}/{n}/1000.jpg",
+                            'huge': f"https://cdn.example.invalid/sites/{site_id}/{n}/2000.jpg"
+                        }
+                        for n in range(3)
+                    ]
+                }
+            })
+    return sites
+
+
+def build_response(sites):
+    elements = [{'type': "singleEntry", 'ident': "divesite", 'data': {'properties': site}} for site in sites]
+    return json.dumps({
+        'stats': {'total': len(sites)},
+        'result': {'type': "collection", 'ident': "mixed", 'elements': elements}
+    }, indent=4).encode('utf-8')
+
+
+def parse_bounds(body, content_type):
+    """Extract geoBounds from a multipart or urlencoded 'request' form field"""
+    if 'multipart/form-data' in content_type:
+        match = REQUEST_FIELD_PATTERN.search(body)
+        if not match:
+            raise ValueError("missing 'request' field")
+        request = json.loads(match.group(1).decode('utf-8'))
+    else:
+        fields = dict(part.split('=', 1) for part in body.decode('utf-8').split('&') if '=' in part)
+        request = json.loads(unquote_plus(fields['request']))
+    if request.get('type') != 'BOUNDS_CHANGED':
+        raise ValueError(f"unsupported request type {request.get('type')!r}")
+    bounds = request['filter']['geoBounds']
+    return {k: float(bounds[k]) for k in ('south', 'west', 'north', 'east')}
+
+
+class MockSiteServer:
+    """asyncio HTTP/1.1 server answering BOUNDS_CHANGED requests with grid sites"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, step=GRID_STEP, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.step = step
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.connections = 0
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                lines = head.decode('latin-1').split('\r\n')
+                method, path, _ = (lines[0].split(' ', 2) + ['', ''])[:3]
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0) or 0))
+                self.requests += 1
+
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if method != 'POST' or not path.startswith('/api/locationServices.php'):
+                    status, payload = "404 Not Found", b'{"error": "not found"}'
+                elif self.error_rate and self.random.random() < self.error_rate:
+                    self.errors += 1
+                    status, payload = "503 Service Unavailable", b'{"error": "try again"}'
+                else:
+                    try:
+                        bounds = parse_bounds(body, headers.get('content-type', ''))
+                        status, payload = "200 OK", build_response(grid_sites(bounds, self.step))
+                    except (ValueError, KeyError) as e:
+                        status, payload = "400 Bad Request", json.dumps({'error': str(e)}).encode('utf-8')
+
+                close = headers.get('connection', '').lower() == 'close'
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'close' if close else 'keep-alive'}\r\n"
+                    "\r\n".encode('latin-1') + payload
+                )
+                await writer.drain()
+                if close:
+                    return
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8765):
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+
+
+async def serve(args):
+    mock = MockSiteServer(args.latency, args.error_rate, args.step, args.seed)
+    server = await mock.start(args.host, args.port)
+    port = server.sockets[0].getsockname()[1]
+    print(f"Mock locationServices.php at http://{args.host}:{port}/api/locationServices.php "
+          f"(latency {args.latency}s, error rate {args.error_rate:.0%}), Ctrl+C to stop")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        print(f"Served {mock.requests} requests on {mock.connections} connections, {mock.errors} simulated errors")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the SSI dive site API")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on (default: 8765, 0 for any)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds to delay each response (default: 0)")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Fraction of requests answered with 503 (default: 0)")
+    parser.add_argument('--step', type=float, default=GRID_STEP,
+                        help=f"Degrees between generated sites (default: {GRID_STEP})")
+    parser.add_argument('--seed', type=int, help="Random seed for the simulated errors")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
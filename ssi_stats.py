@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Shearwater Logbook Statistics
+Summarizes one or more Shearwater databases with SQLite aggregate queries
+
+Usage:
+    python ssi_stats.py shearwater_databases/*.db
+
+All grouping and summing happens inside SQLite, so only the aggregated rows
+(one per year, month, histogram bucket or site) reach Python. Several databases
+are merged by adding up their aggregates.
+
+DISCLAIMER: This software is for DEMONSTRATION AND EDUCATIONAL PURPOSES ONLY.
+Not affiliated with Shearwater Research Inc., SSI, or any diving organization.
+USE AT YOUR OWN RISK. See DISCLAIMER.md for full legal disclaimer.
+"""
+
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+
+DEPTH_BUCKET_M = 5
+DURATION_BUCKET_MIN = 10
+TOP_SITES = 50
+
+# Only rows whose DiveDate is a real 'YYYY-MM-DD HH:MM:SS' timestamp, the format the QR codes are
+# built from, are used for the calendar breakdowns. The '+0 days' modifier makes datetime() normalize
+# impossible dates such as Feb 30, so they no longer compare equal
+VALID_DATE = "datetime(DiveDate, '+0 days') = DiveDate"
+
+TOTALS_QUERY = """
+SELECT COUNT(*),
+       COALESCE(SUM(CAST(DiveLengthTime AS REAL)), 0),
+       COALESCE(MAX(CAST(Depth AS REAL)), 0),
+       COALESCE(SUM(CAST(Depth AS REAL)), 0),
+       COUNT(Depth),
+       MIN(CASE WHEN {valid} THEN DiveDate END),
+       MAX(CASE WHEN {valid} THEN DiveDate END)
+FROM dive_details
+""".format(valid=VALID_DATE)
+
+MONTH_QUERY = """
+SELECT substr(DiveDate, 1, 7) AS month,
+       COUNT(*),
+       COALESCE(SUM(CAST(DiveLengthTime AS REAL)), 0)
+FROM dive_details
+WHERE {valid}
+GROUP BY month
+""".format(valid=VALID_DATE)
+
+HISTOGRAM_QUERY = """
+SELECT CAST(COALESCE(CAST({column} AS REAL), 0) / {bucket} AS INTEGER) AS bucket, COUNT(*)
+FROM dive_details
+GROUP BY bucket
+"""
+
+SITES_QUERY = """
+SELECT COALESCE(NULLIF(TRIM(Site), ''), '(no site)') AS site_name,
+       COALESCE(NULLIF(TRIM(Location), ''), '') AS location_name,
+       COUNT(*),
+       COALESCE(SUM(CAST(DiveLengthTime AS REAL)), 0),
+       COALESCE(MAX(CAST(Depth AS REAL)), 0)
+FROM dive_details
+GROUP BY site_name, location_name
+"""
+
+
+def _add(totals, key, values):
+    current = totals.get(key)
+    totals[key] = values if current is None else [a + b for a, b in zip(current, values)]
+
+
+def compute_logbook_stats(db_paths):
+    """Aggregate dives per year and month, depth/duration histograms and per-site counts"""
+    if isinstance(db_paths, str):
+        db_paths = [db_paths]
+
+    stats = {'dives': 0, 'total_seconds': 0.0, 'max_depth': 0.0, 'avg_depth': 0.0,
+             'first_dive': None, 'last_dive': None}
+    # Dives without a depth are left out of the average, so it is merged from sums and counts
+    depth_sum, depth_count = 0.0, 0
+    years, months, depth_hist, duration_hist, sites = {}, {}, {}, {}, {}
+
+    for db_path in db_paths:
+        conn = sqlite3.connect(Path(db_path).resolve().as_uri() + '?mode=ro', uri=True)
+        try:
+            count, seconds, max_depth, depth_total, depths, first, last = conn.execute(TOTALS_QUERY).fetchone()
+            stats['dives'] += count
+            stats['total_seconds'] += seconds
+            stats['max_depth'] = max(stats['max_depth'], max_depth)
+            depth_sum += depth_total
+            depth_count += depths
+            if first and (stats['first_dive'] is None or first < stats['first_dive']):
+                stats['first_dive'] = first
+            if last and (stats['last_dive'] is None or last > stats['last_dive']):
+                stats['last_dive'] = last
+
+            # Years are summed from the (at most 12 per year) month rows instead of another table scan
+            for month, n, secs in conn.execute(MONTH_QUERY):
+                _add(months, month, [n, secs])
+                _add(years, month[:4], [n, secs])
+            for bucket, n in conn.execute(HISTOGRAM_QUERY.format(column='Depth', bucket=DEPTH_BUCKET_M)):
+                _add(depth_hist, bucket, [n])
+            for bucket, n in conn.execute(HISTOGRAM_QUERY.format(column='DiveLengthTime', bucket=DURATION_BUCKET_MIN * 60)):
+                _add(duration_hist, bucket, [n])
+            for site, location, n, secs, deepest in conn.execute(SITES_QUERY):
+                current = sites.get((site, location))
+                if current is None:
+                    sites[(site, location)] = [n, secs, deepest]
+                else:
+                    sites[(site, location)] = [current[0] + n, current[1] + secs, max(current[2], deepest)]
+        finally:
+            conn.close()
+
+    if depth_count:
+        stats['avg_depth'] = depth_sum / depth_count
+
+    def with_cumulative(periods):
+        rows, running = [], 0.0
+        for period in sorted(periods):
+            n, secs = periods[period]
+            running += secs
+            rows.append((period, n, secs, running))
+        return rows
+
+    stats['by_year'] = with_cumulative(years)
+    stats['by_month'] = with_cumulative(months)
+    stats['depth_histogram'] = [(b * DEPTH_BUCKET_M, (b + 1) * DEPTH_BUCKET_M, depth_hist[b][0]) for b in sorted(depth_hist)]
+    stats['duration_histogram'] = [(b * DURATION_BUCKET_MIN, (b + 1) * DURATION_BUCKET_MIN, duration_hist[b][0])
+                                   for b in sorted(duration_hist)]
+    stats['sites'] = sorted(((site, location, n, secs, deepest) for (site, location), (n, secs, deepest) in sites.items()),
+                            key=lambda row: (-row[2], row[0]))
+    return stats
+
+
+def _hours(seconds):
+    return f"{seconds / 3600:.1f}h"
+
+
+def _bar(count, largest, width=30):
+    return '#' * max(1, round(width * count / largest)) if count else ''
+
+
+def format_stats_report(stats, top_sites=TOP_SITES):
+    """Render statistics as a plain-text report"""
+    lines = [
+        f"Dives: {stats['dives']}",
+        f"Bottom time: {_hours(stats['total_seconds'])}",
+        f"Max depth: {stats['max_depth']:.1f}m, average max depth: {stats['avg_depth']:.1f}m",
+        f"First dive: {stats['first_dive'] or 'N/A'}",
+        f"Last dive: {stats['last_dive'] or 'N/A'}",
+        "",
+        "Per year (dives, bottom time, cumulative):"
+    ]
+    for period, n, secs, running in stats['by_year']:
+        lines.append(f"  {period:<8}{n:>7}{_hours(secs):>10}{_hours(running):>10}")
+
+    lines += ["", "Per month (dives, bottom time, cumulative):"]
+    for period, n, secs, running in stats['by_month']:
+        lines.append(f"  {period:<8}{n:>7}{_hours(secs):>10}{_hours(running):>10}")
+
+    for title, unit, histogram in (("Max depth distribution:", "m", stats['depth_histogram']),
+                                   ("Duration distribution:", "min", stats['duration_histogram'])):
+        lines += ["", title]
+        largest = max((count for _, _, count in histogram), default=0)
+        for low, high, count in histogram:
+            label = f"{low}-{high}{unit}"
+            lines.append(f"  {label:<11}{count:>7}  {_bar(count, largest)}")
+
+    lines += ["", f"Top sites (dives, bottom time, max depth) of {len(stats['sites'])}:"]
+    for site, location, n, secs, deepest in stats['sites'][:top_sites]:
+        name = f"{site}, {location}" if location else site
+        lines.append(f"  {name[:40]:<40}{n:>7}{_hours(secs):>10}{deepest:>8.1f}m")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show statistics for Shearwater logbooks")
+    parser.add_argument('databases', nargs='+', help="Shearwater .db exports (merged into one report)")
+    parser.add_argument('--top-sites', type=int, default=TOP_SITES, help=f"Sites to list (default: {TOP_SITES})")
+    args = parser.parse_args(argv)
+
+    try:
+        stats = compute_logbook_stats(args.databases)
+    except sqlite3.Error as e:
+        print(f"Could not read logbook: {e}")
+        return 1
+    print(format_stats_report(stats, args.top_sites))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())